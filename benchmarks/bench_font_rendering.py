@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.font_manager import FontManager
+
+
+def legacy_font(font_size):
+    # 原来每个单词都调用一次的 get_default_font
+    try:
+        return ImageFont.truetype(font="arial.ttf", size=font_size)
+    except IOError:
+        try:
+            return ImageFont.truetype(font="arial.ttf", size=font_size)
+        except IOError:
+            return ImageFont.load_default()
+
+
+def synthetic_words(count, width, height, seed=0):
+    # 合成单词列表：(x, y, text, font_size)，字号分布在少数几个值上
+    rng = np.random.default_rng(seed)
+    sizes = rng.choice([24, 28, 32, 40], size=count, p=[0.6, 0.2, 0.15, 0.05])
+    xs = rng.integers(0, width - 200, count)
+    ys = rng.integers(0, height - 50, count)
+    return [(int(x), int(y), f"word{i}", int(size)) for i, (x, y, size) in enumerate(zip(xs, ys, sizes))]
+
+
+def render_legacy(words, width, height):
+    image = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(image)
+    for x, y, text, font_size in words:
+        draw.text((x, y), text, font=legacy_font(font_size), fill=(255, 255, 255))
+    return image
+
+
+def render_managed(words, width, height, manager):
+    image = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(image)
+    manager.render_words(draw, words, fill=(255, 255, 255))
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR re-render stage font handling")
+    parser.add_argument('--words', type=int, default=5000)
+    parser.add_argument('--width', type=int, default=4960)
+    parser.add_argument('--height', type=int, default=7016)
+    parser.add_argument('--font', default=None, help="Font path passed to FontManager")
+    args = parser.parse_args()
+
+    words = synthetic_words(args.words, args.width, args.height)
+
+    start = time.perf_counter()
+    render_legacy(words, args.width, args.height)
+    legacy_time = time.perf_counter() - start
+
+    manager = FontManager(args.font)
+    start = time.perf_counter()
+    render_managed(words, args.width, args.height, manager)
+    managed_time = time.perf_counter() - start
+
+    print(f"{args.words} words on a {args.width}x{args.height} page, font: {manager.resolve_font_path() or 'default'}")
+    print(f"per-word font lookup: {legacy_time * 1000:9.1f} ms")
+    print(f"FontManager:          {managed_time * 1000:9.1f} ms")
+    print(f"speedup:              {legacy_time / managed_time:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.dpi_enhancer import DPIEnhancer
+from processing.execution_settings import ExecutionSettings
+from processing.image_segmentation import ImageSegmenter
+from processing.ocr_runner import tesseract_version
+from processing.scale_planner import SR_TIER_CHOICES
+from processing.tif_reader import TIFReader
+from utils.image_utils import adjust_gamma, mask_bounding_boxes, sharpen_image
+
+# 纸张尺寸（英寸）
+PAGE_SIZES = {
+    'A5': (5.83, 8.27),
+    'A4': (8.27, 11.69),
+    'A3': (11.69, 16.54),
+}
+PAGE_KINDS = ('text', 'photo', 'mixed', 'speckled')
+
+
+class NullCache:
+    # 基准测试每次都要真正计算，不使用分割/OCR 缓存
+    def get(self, key):
+        return None
+
+    def put(self, key, value):
+        pass
+
+
+class StandInSR:
+    # 没有 EDSR 模型文件时用双三次插值代替，只保证输出尺寸一致
+    name = 'bicubic-stand-in'
+
+    def __init__(self, scale=4):
+        self.scale = scale
+
+    def load(self):
+        return self
+
+    def upsample(self, image):
+        return cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_CUBIC)
+
+
+def stand_in_ocr(image):
+    # 没有 tesseract 时按连通区域生成单词框，数据格式与 pytesseract.Output.DICT 相同
+    boxes = mask_bounding_boxes((image > 0).astype(np.uint8) * 255, padding=2, min_area=20)
+    data = {key: [] for key in ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                                'left', 'top', 'width', 'height', 'conf', 'text')}
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        for key, value in (('level', 5), ('page_num', 1), ('block_num', 1), ('par_num', 1), ('line_num', 1),
+                           ('word_num', i + 1), ('left', x0), ('top', y0), ('width', x1 - x0),
+                           ('height', y1 - y0), ('conf', '95'), ('text', 'word')):
+            data[key].append(value)
+    return data
+
+
+def tesseract_available():
+    return tesseract_version() != 'unknown'
+
+
+def draw_text_lines(page, x0, y0, x1, y1, dpi, rng):
+    # 约 11pt 的文字行
+    font_scale = dpi / 300.0 * 1.2
+    line_height = max(int(dpi * 11 / 72 * 1.5), 8)
+    thickness = max(int(round(dpi / 150.0)), 1)
+    words = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do")
+    for y in range(y0 + line_height, y1, line_height):
+        line = " ".join(rng.choice(words, size=12))
+        cv2.putText(page, line, (x0, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+
+def draw_photo(page, x0, y0, x1, y1, rng):
+    # 彩色渐变 + 色块 + 噪声，饱和度足以被识别为图像区域
+    h, w = y1 - y0, x1 - x0
+    gx = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+    gy = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    photo = np.empty((h, w, 3), dtype=np.float32)
+    photo[..., 0] = gx
+    photo[..., 1] = gy
+    photo[..., 2] = 255 - (gx + gy) / 2
+    photo += rng.normal(0, 12, size=(h, w, 1)).astype(np.float32)
+    photo = np.clip(photo, 0, 255).astype(np.uint8)
+    for _ in range(12):
+        cx, cy = int(rng.integers(0, w)), int(rng.integers(0, h))
+        radius = int(rng.integers(max(min(h, w) // 20, 1), max(min(h, w) // 5, 2)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(photo, (cx, cy), radius, color, -1)
+    page[y0:y1, x0:x1] = photo
+
+
+def synthesize_page(kind, size, dpi, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = (int(round(inches * dpi)) for inches in PAGE_SIZES[size])
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = int(dpi * 0.75)
+
+    if kind == 'text':
+        draw_text_lines(page, margin, margin, width - margin, height - margin, dpi, rng)
+    elif kind == 'photo':
+        draw_photo(page, margin, margin, width - margin, height - margin, rng)
+    elif kind == 'mixed':
+        split = height // 2
+        draw_text_lines(page, margin, margin, width - margin, split, dpi, rng)
+        draw_photo(page, margin, split, width - margin, height - margin, rng)
+    elif kind == 'speckled':
+        draw_text_lines(page, margin, margin, width - margin, height - margin, dpi, rng)
+        # 扫描噪点：大量 1~3 像素的黑点
+        count = width * height // 400
+        ys = rng.integers(0, height, count)
+        xs = rng.integers(0, width, count)
+        page[ys, xs] = 0
+        page[np.minimum(ys + 1, height - 1), xs] = 0
+    else:
+        raise ValueError(f"Unknown page kind: {kind}")
+    return page
+
+
+def write_tif(path, page, dpi):
+    Image.fromarray(page).save(path, dpi=(dpi, dpi))
+
+
+def time_call(fn, repeat, setup=None):
+    # setup 在计时之外执行，返回传给 fn 的参数（例如原地修改的掩码副本）
+    times = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return {
+        'min': round(min(times), 6),
+        'median': round(statistics.median(times), 6),
+        'repeat': repeat,
+    }, result
+
+
+def bench_case(path, kind, size, dpi, target_dpi, repeat, enhance_repeat, enhancer, sr_tier=None):
+    segmenter = ImageSegmenter(cache=NullCache())
+    results = {}
+
+    results['read_image'], image = time_call(lambda: TIFReader(path).read_image(), repeat)
+    results['segment_image'], (text_mask, image_mask) = time_call(lambda: segmenter.segment_image(image), repeat)
+    results['refine_masks'], _ = time_call(
+        segmenter.refine_masks, repeat, setup=lambda: (text_mask.copy(), image_mask.copy(), image))
+    results['remove_small_regions'], _ = time_call(
+        segmenter.remove_small_regions, repeat, setup=lambda: (text_mask.copy(), segmenter.text_refine_min_size))
+    results['adjust_gamma'], _ = time_call(lambda: adjust_gamma(image, 1.5), repeat)
+    results['sharpen_image'], _ = time_call(lambda: sharpen_image(image, 1.0), repeat)
+
+    refined_text, refined_image = segmenter.refine_masks(text_mask.copy(), image_mask.copy(), image)
+    results['enhance'], enhanced = time_call(
+        lambda: enhancer.enhance(image, refined_text, refined_image, dpi, target_dpi, 'Lanczos', sr_tier=sr_tier),
+        enhance_repeat)
+
+    return {
+        'kind': kind,
+        'size': size,
+        'dpi': dpi,
+        'target_dpi': target_dpi,
+        'shape': list(image.shape),
+        'output_shape': list(enhanced.shape),
+        'sr_plan': repr(enhancer.last_plan),
+        'timings': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_enhancer(force_stand_ins, execution=None):
+    enhancer = DPIEnhancer(execution=execution)
+    enhancer.segmenter.cache = NullCache()
+    enhancer.ocr.cache = NullCache()
+    stand_ins = []
+
+    if force_stand_ins or not enhancer.registry.is_available('edsr', 4):
+        enhancer.sr = StandInSR(4)
+        enhancer.upscaler.sr = enhancer.sr
+        stand_ins.append('edsr')
+    else:
+        enhancer.sr.load()
+
+    if force_stand_ins or not tesseract_available():
+        enhancer.ocr._ocr = stand_in_ocr
+        stand_ins.append('tesseract')
+
+    return enhancer, stand_ins
+
+
+def compare(results, baseline_path):
+    # 与之前保存的结果逐项对比，打印耗时比值
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(c['kind'], c['size'], c['dpi']): c for c in baseline['cases']}
+    print(f"\ncompared with {baseline_path} ({(baseline.get('commit') or 'unknown')[:10]}):")
+    for case in results['cases']:
+        old = previous.get((case['kind'], case['size'], case['dpi']))
+        if old is None:
+            continue
+        for name, timing in case['timings'].items():
+            old_timing = old['timings'].get(name)
+            if old_timing and old_timing['min'] > 0:
+                ratio = timing['min'] / old_timing['min']
+                print(f"  {case['kind']:>8} {case['size']} {case['dpi']:>4}dpi {name:<22}"
+                      f"{old_timing['min'] * 1000:10.1f} -> {timing['min'] * 1000:10.1f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the enhancement pipeline on synthetic TIFF pages")
+    parser.add_argument('--kinds', nargs='+', default=list(PAGE_KINDS), choices=PAGE_KINDS)
+    parser.add_argument('--sizes', nargs='+', default=['A4'], choices=sorted(PAGE_SIZES))
+    parser.add_argument('--dpis', nargs='+', type=int, default=[150, 300])
+    parser.add_argument('--target-scale', type=float, default=2.0, help="target_dpi = dpi * target-scale")
+    parser.add_argument('--sr-tier', default='quality', choices=SR_TIER_CHOICES)
+    parser.add_argument('--threads', type=int, default=None, help="OpenCV thread count (default: OpenCV default)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--enhance-repeat', type=int, default=1)
+    parser.add_argument('--stand-ins', action='store_true',
+                        help="Always use the EDSR/tesseract stand-ins so results are comparable across machines")
+    parser.add_argument('--work-dir', default=None, help="Where the synthetic TIFFs are written (default: temp dir)")
+    parser.add_argument('--output', default=None, help="JSON result path (default: bench_pipeline_<commit>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    enhancer, stand_ins = make_enhancer(args.stand_ins, ExecutionSettings(num_threads=args.threads))
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'execution': enhancer.execution.to_dict(),
+            'numpy': np.__version__,
+            'tesseract': tesseract_version(),
+        },
+        'stand_ins': stand_ins,
+        'sr_tier': args.sr_tier,
+        'cases': [],
+    }
+    if stand_ins:
+        print(f"using stand-ins for: {', '.join(stand_ins)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        for size in args.sizes:
+            for dpi in args.dpis:
+                for seed, kind in enumerate(args.kinds):
+                    path = os.path.join(work_dir, f"{kind}_{size}_{dpi}.tif")
+                    write_tif(path, synthesize_page(kind, size, dpi, seed), dpi)
+                    target_dpi = int(round(dpi * args.target_scale))
+                    case = bench_case(path, kind, size, dpi, target_dpi, args.repeat, args.enhance_repeat, enhancer,
+                                      args.sr_tier)
+                    results['cases'].append(case)
+
+                    timings = case['timings']
+                    print(f"{kind:>8} {size} {dpi:>4}dpi {case['shape'][1]}x{case['shape'][0]}: "
+                          + "  ".join(f"{name} {t['min'] * 1000:.1f}ms" for name, t in timings.items()))
+
+    output = args.output or f"bench_pipeline_{(commit or 'local')[:10]}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
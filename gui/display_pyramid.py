@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import cv2
+
+
+class DisplayPyramid:
+    # 显示用的降采样金字塔：先一次缩小到不超过 max_dimension，再逐级减半。
+    # 重绘时只在视口大小（或缩放）改变时才重新缩放，全分辨率图像本身不会被复制
+    def __init__(self, image, max_dimension=4096, max_cached=4):
+        self.image = image
+        self.max_dimension = max_dimension
+        self.max_cached = max_cached
+        self._levels = None
+        self._fitted = OrderedDict()
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def display_size(self, viewport_width, viewport_height, zoom=1.0):
+        # 保持宽高比适应视口，zoom 在此基础上再缩放
+        height, width = self.image.shape[:2]
+        ratio = min(max(viewport_width, 1) / width, max(viewport_height, 1) / height) * zoom
+        return max(int(width * ratio), 1), max(int(height * ratio), 1)
+
+    def levels(self):
+        if self._levels is None:
+            height, width = self.image.shape[:2]
+            ratio = self.max_dimension / max(width, height)
+            if ratio < 1.0:
+                level = cv2.resize(self.image, (max(int(width * ratio), 1), max(int(height * ratio), 1)),
+                                   interpolation=cv2.INTER_AREA)
+            else:
+                level = self.image
+            levels = [level]
+            while min(level.shape[:2]) >= 512:
+                level = cv2.resize(level, (level.shape[1] // 2, level.shape[0] // 2), interpolation=cv2.INTER_AREA)
+                levels.append(level)
+            self._levels = levels
+        return self._levels
+
+    def level_for(self, width, height):
+        # 取不小于目标尺寸的最小一级；比所有级别都大时（放大查看）直接用原图
+        for level in reversed(self.levels()):
+            if level.shape[1] >= width and level.shape[0] >= height:
+                return level
+        return self.image
+
+    def fit(self, width, height):
+        # 返回恰好 width x height 的显示图像，结果按尺寸缓存
+        key = (width, height)
+        fitted = self._fitted.get(key)
+        if fitted is not None:
+            self._fitted.move_to_end(key)
+            return fitted
+
+        level = self.level_for(width, height)
+        if level.shape[1] == width and level.shape[0] == height:
+            fitted = level
+        else:
+            shrinking = level.shape[1] > width
+            fitted = cv2.resize(level, (width, height),
+                                interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+        self._fitted[key] = fitted
+        while len(self._fitted) > self.max_cached:
+            self._fitted.popitem(last=False)
+        return fitted
+
+    def fit_viewport(self, viewport_width, viewport_height, zoom=1.0):
+        return self.fit(*self.display_size(viewport_width, viewport_height, zoom))
@@ -0,0 +1,134 @@
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+
+class Job(QRunnable):
+    # fn(report, *args) 在线程池中执行；report(stage) 上报阶段进度，任务被取消时抛出 JobCancelled
+    def __init__(self, job_id, key, fn, args):
+        super().__init__()
+        self.job_id = job_id
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.signals = JobSignals()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, stage=None):
+        # stage 为 None 时只检查是否已取消，用于阶段内部的循环
+        if self.is_cancelled:
+            raise JobCancelled()
+        if stage is not None:
+            self.signals.progress.emit(self.job_id, stage)
+
+    def run(self):
+        try:
+            if self.is_cancelled:
+                raise JobCancelled()
+            result = self.fn(self.report, *self.args)
+            if self.is_cancelled:
+                raise JobCancelled()
+        except JobCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self.job_id, str(e))
+        else:
+            self.signals.finished.emit(self.job_id, result)
+
+
+class JobExecutor(QObject):
+    # 同一个 key 同时只保留最新的任务，新任务会取消并取代旧任务
+    def __init__(self, parent=None, max_threads=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self._next_id = 0
+        self._jobs = {}
+        self._callbacks = {}
+        self._current = {}
+
+    def submit(self, key, fn, *args, on_progress=None, on_finished=None, on_failed=None, on_cancelled=None):
+        self.cancel(key)
+
+        self._next_id += 1
+        job = Job(self._next_id, key, fn, args)
+        self._jobs[job.job_id] = job
+        self._callbacks[job.job_id] = (on_progress, on_finished, on_failed, on_cancelled)
+        self._current[key] = job.job_id
+
+        # 信号连接到本对象（位于 GUI 线程）的方法上，回调总是在 GUI 线程中执行
+        job.signals.progress.connect(self._on_progress)
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        job.signals.cancelled.connect(self._on_cancelled)
+        self.pool.start(job)
+        return job.job_id
+
+    def cancel(self, key):
+        job_id = self._current.pop(key, None)
+        if job_id is not None and job_id in self._jobs:
+            self._jobs[job_id].cancel()
+
+    def cancel_all(self):
+        for key in list(self._current):
+            self.cancel(key)
+
+    def is_running(self, key):
+        return key in self._current
+
+    def _is_current(self, job_id):
+        job = self._jobs.get(job_id)
+        return job is not None and self._current.get(job.key) == job_id
+
+    def _finish(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        callbacks = self._callbacks.pop(job_id, (None, None, None, None))
+        if job is not None and self._current.get(job.key) == job_id:
+            del self._current[job.key]
+            return callbacks
+        # 已被取代的任务不再回调
+        return None, None, None, None
+
+    def _on_progress(self, job_id, stage):
+        if self._is_current(job_id):
+            on_progress = self._callbacks[job_id][0]
+            if on_progress:
+                on_progress(stage)
+
+    def _on_finished(self, job_id, result):
+        on_finished = self._finish(job_id)[1]
+        if on_finished:
+            on_finished(result)
+
+    def _on_failed(self, job_id, message):
+        on_failed = self._finish(job_id)[2]
+        if on_failed:
+            on_failed(message)
+
+    def _on_cancelled(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        on_cancelled = self._callbacks.pop(job_id, (None, None, None, None))[3]
+        # 被新任务取代的任务静默结束，只有显式取消时才通知调用方
+        if job is not None and on_cancelled and job.key not in self._current:
+            on_cancelled()
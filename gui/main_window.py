@@ -1,15 +1,21 @@
 from PyQt6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QLabel, 
                              QWidget, QSpinBox, QGroupBox, QTextEdit, QSlider, QComboBox, QToolBar, QColorDialog)
-from PyQt6.QtCore import Qt, QPoint
-from PyQt6.QtGui import QPixmap, QImage, QPainter, QPen, QMouseEvent, QColor, QAction
+from PyQt6.QtCore import Qt, QPoint, QRect, QTimer
+from PyQt6.QtGui import QPainter, QPen, QMouseEvent, QColor, QAction
 from processing.tif_reader import TIFReader
 from processing.background_remover import BackgroundRemover
 from processing.dpi_enhancer import DPIEnhancer
+from processing.execution_settings import ExecutionSettings
 from utils.image_utils import adjust_gamma, sharpen_image
 from processing.image_segmentation import ImageSegmenter
-import cv2
-import numpy as np
+from utils.cache_utils import DEFAULT_CACHE_DIR
+from gui.preview_engine import PreviewEngine, apply_adjustments, slider_params
+from gui.job_executor import JobExecutor
+from gui.display_pyramid import DisplayPyramid
+from gui.mask_overlay import MaskOverlay
+from gui.qt_image import to_pixmap
 import os
+import time
 
 class ImageLabel(QLabel):
     def __init__(self, parent=None):
@@ -20,6 +26,21 @@ class ImageLabel(QLabel):
         self.show_comparison = False
         self.slider_width = 20
         self.slider_height = 40
+        # 对比模式下左右两侧的显示尺寸 pixmap，拖动滑块时只在 paintEvent 中按裁剪区域重绘
+        self.left_pixmap = None
+        self.right_pixmap = None
+        # 显示的图像总是按视口缩放后再设置，允许窗口缩小到比当前图像小
+        self.setMinimumSize(1, 1)
+
+    def set_comparison(self, left_pixmap, right_pixmap):
+        self.left_pixmap = left_pixmap
+        self.right_pixmap = right_pixmap
+        self.update()
+
+    def clear_comparison(self):
+        self.left_pixmap = None
+        self.right_pixmap = None
+        self.update()
 
     def mousePressEvent(self, event: QMouseEvent):
         if self.show_comparison:
@@ -33,22 +54,41 @@ class ImageLabel(QLabel):
     def mouseMoveEvent(self, event: QMouseEvent):
         if self.dragging and self.show_comparison:
             self.split_ratio = max(0.1, min(0.9, event.position().x() / self.width()))
-            self.parent.update_split_image()
+            # 不重新合成图像，只触发重绘
+            self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.parent.refresh_display()
 
     def paintEvent(self, event):
-        super().paintEvent(event)
-        if self.pixmap() and self.show_comparison:
-            painter = QPainter(self)
-            pen = QPen(Qt.GlobalColor.white)
-            pen.setWidth(2)
-            painter.setPen(pen)
-            x = int(self.width() * self.split_ratio)
-            painter.drawLine(x, 0, x, self.height())
-            
-            # 绘制滑块
-            slider_x = x - self.slider_width // 2
-            slider_y = (self.height() - self.slider_height) // 2
-            painter.fillRect(slider_x, slider_y, self.slider_width, self.slider_height, Qt.GlobalColor.white)
+        comparing = self.show_comparison and self.left_pixmap is not None and self.right_pixmap is not None
+        if not comparing:
+            super().paintEvent(event)
+            return
+
+        painter = QPainter(self)
+        x = int(self.width() * self.split_ratio)
+
+        # 两张 pixmap 居中绘制，分别裁剪到分割线左右两侧
+        offset_x = (self.width() - self.left_pixmap.width()) // 2
+        offset_y = (self.height() - self.left_pixmap.height()) // 2
+        painter.setClipRect(QRect(0, 0, x, self.height()))
+        painter.drawPixmap(offset_x, offset_y, self.left_pixmap)
+        painter.setClipRect(QRect(x, 0, self.width() - x, self.height()))
+        painter.drawPixmap(offset_x, offset_y, self.right_pixmap)
+        painter.setClipping(False)
+
+        pen = QPen(Qt.GlobalColor.white)
+        pen.setWidth(2)
+        painter.setPen(pen)
+        painter.drawLine(x, 0, x, self.height())
+        
+        # 绘制滑块
+        slider_x = x - self.slider_width // 2
+        slider_y = (self.height() - self.slider_height) // 2
+        painter.fillRect(slider_x, slider_y, self.slider_width, self.slider_height, Qt.GlobalColor.white)
+        painter.end()
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -97,9 +137,13 @@ class MainWindow(QMainWindow):
         self.dpi_spinbox.setValue(300)
         self.enhance_button = QPushButton("Enhance DPI")
         self.enhance_button.clicked.connect(self.enhance_dpi)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_enhancement)
+        self.cancel_button.setEnabled(False)
         dpi_layout.addWidget(self.dpi_label)
         dpi_layout.addWidget(self.dpi_spinbox)
         dpi_layout.addWidget(self.enhance_button)
+        dpi_layout.addWidget(self.cancel_button)
         dpi_group.setLayout(dpi_layout)
         left_layout.addWidget(dpi_group)
 
@@ -122,7 +166,12 @@ class MainWindow(QMainWindow):
         self.interpolation_label = QLabel("Interpolation Method:")
         self.interpolation_combo = QComboBox()
         self.interpolation_combo.addItems(["Nearest", "Bilinear", "Bicubic", "Lanczos"])
-        self.interpolation_combo.currentTextChanged.connect(self.update_preview)
+        self.interpolation_combo.currentTextChanged.connect(self.schedule_enhance)
+
+        self.sr_tier_label = QLabel("Super-Resolution:")
+        self.sr_tier_combo = QComboBox()
+        self.sr_tier_combo.addItems(["Quality", "Balanced", "Fast", "Draft", "Auto"])
+        self.sr_tier_combo.currentTextChanged.connect(self.schedule_enhance)
         
         processing_layout.addWidget(self.sharpness_label)
         processing_layout.addWidget(self.sharpness_slider)
@@ -130,6 +179,8 @@ class MainWindow(QMainWindow):
         processing_layout.addWidget(self.gamma_slider)
         processing_layout.addWidget(self.interpolation_label)
         processing_layout.addWidget(self.interpolation_combo)
+        processing_layout.addWidget(self.sr_tier_label)
+        processing_layout.addWidget(self.sr_tier_combo)
         processing_group.setLayout(processing_layout)
         left_layout.addWidget(processing_group)
 
@@ -191,10 +242,37 @@ class MainWindow(QMainWindow):
         self.processed_image = None
         self.text_mask = None
         self.image_mask = None
+        # 显示用的降采样金字塔，重绘时只处理视口大小的数据
+        self.original_pyramid = None
+        self.processed_pyramid = None
+        # 掩码叠加层，缓存显示尺寸的颜色层和叠加结果
+        self.mask_overlay = None
+        self.showing_preview = False
         self.text_mask_color = QColor(255, 0, 0, 64)  # 半透明红色
         self.image_mask_color = QColor(0, 255, 0, 64)  # 半透明绿色
 
         self.segmenter = ImageSegmenter()
+        # 整个窗口共用一个增强器，模型只在第一次增强时加载一次
+        # 界面一次只处理一页，默认让 OpenCV 使用全部核心；可用 TIF_DPI_THREADS 等环境变量调整。
+        # 保留 OCR 和超分辨率的中间结果，只改目标 DPI 重新增强时只重做插值和文字渲染
+        self.dpi_enhancer = DPIEnhancer(cache_dir=DEFAULT_CACHE_DIR, keep_intermediates=True,
+                                        execution=ExecutionSettings.from_env(default_threads=os.cpu_count()))
+
+        # 所有耗时处理都在后台线程中执行，同类的新任务会取代旧任务
+        self.jobs = JobExecutor(self)
+
+        # 预览：滑块先渲染低分辨率代理图，全分辨率渲染防抖后在后台执行
+        self.preview_engine = PreviewEngine()
+        self.preview_generation = 0
+        self.processed_generation = 0
+        self.full_render_timer = QTimer(self)
+        self.full_render_timer.setSingleShot(True)
+        self.full_render_timer.setInterval(250)
+        self.full_render_timer.timeout.connect(self.start_full_render)
+        self.enhance_timer = QTimer(self)
+        self.enhance_timer.setSingleShot(True)
+        self.enhance_timer.setInterval(500)
+        self.enhance_timer.timeout.connect(self.enhance_dpi)
 
     def select_file(self):
         file_dialog = QFileDialog()
@@ -207,12 +285,18 @@ class MainWindow(QMainWindow):
     def load_image(self):
         try:
             tif_reader = TIFReader(self.file_path)
+            self.page_count = tif_reader.page_count
             self.original_dpi = tif_reader.get_dpi()
             self.original_image = tif_reader.read_image()
-            self.processed_image = None
+            self.original_pyramid = DisplayPyramid(self.original_image)
+            self.set_processed_image(None)
+            self.set_masks(None, None)
+            self.preview_engine.set_base(None)
+            self.jobs.cancel_all()
+            self.cancel_button.setEnabled(False)
 
             self.update_info()
-            self.display_image(self.original_image)
+            self.update_display()
             self.save_button.setEnabled(False)
         except Exception as e:
             self.status_label.setText(f"Error loading image: {str(e)}")
@@ -222,20 +306,64 @@ class MainWindow(QMainWindow):
         info += f"Current DPI: {self.original_dpi}\n"
         info += f"Image Size: {self.original_image.shape[1]}x{self.original_image.shape[0]}\n"
         info += f"Color Channels: {self.original_image.shape[2]}"
+        if self.page_count > 1:
+            info += f"\nPages: {self.page_count} (showing page 1)"
+        plan = self.dpi_enhancer.last_plan
+        if plan is not None:
+            model = f"{plan.model[0]} x{plan.model[1]}" if plan.model else "interpolation only"
+            info += f"\nSuper-resolution: {model} ({plan.tier})"
+        execution = self.dpi_enhancer.execution
+        info += (f"\nThreads: {execution.num_threads or 'default'}, "
+                 f"DNN: {execution.resolved_backend}/{execution.resolved_target}")
+        for model in self.dpi_enhancer.registry.stats():
+            if model['loaded']:
+                memory_mb = (model['memory_bytes'] or 0) / (1024 * 1024)
+                info += f"\nModel: {model['name']} x{model['scale']} (loaded in {model['load_seconds']:.2f}s, {memory_mb:.0f} MB)"
         self.info_text.setText(info)
 
+    def viewport_size(self):
+        return self.image_label.width(), self.image_label.height()
+
     def display_image(self, image):
+        # image 可以是任意大小，按视口缩放后再转换
+        self.show_display_image(DisplayPyramid(image).fit_viewport(*self.viewport_size()))
+
+    def show_display_image(self, image):
         try:
-            height, width, channel = image.shape
-            bytes_per_line = 3 * width
-            q_image = QImage(image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_image)
-            self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+            # image 已经是视口大小，零拷贝包装后只复制一次到 QPixmap
+            self.image_label.setPixmap(to_pixmap(image))
         except Exception as e:
             print(f"Error displaying image: {str(e)}")
             print(f"Image shape: {image.shape}")
             print(f"Image dtype: {image.dtype}")
 
+    def refresh_display(self):
+        # 视口大小改变后按新的大小重新显示当前内容；窗口初始化完成前也会收到 resize 事件
+        if getattr(self, 'original_pyramid', None) is None:
+            return
+        if self.image_label.show_comparison and self.preview_engine.base_image is not None:
+            self.update_split_image()
+        elif self.showing_preview and self.preview_engine.base_image is not None:
+            width, height = self.viewport_size()
+            self.display_image(self.preview_engine.render_proxy(width, height, *self.current_adjustments()))
+        else:
+            self.update_display()
+
+    def set_processed_image(self, image, pyramid=None):
+        # pyramid 为后台任务中已经生成各级的 DisplayPyramid；未提供时第一次显示才生成
+        self.processed_image = image
+        if pyramid is None and image is not None:
+            pyramid = DisplayPyramid(image)
+        self.processed_pyramid = pyramid
+
+    def set_masks(self, text_mask, image_mask, overlay=None):
+        # overlay 为后台任务中已经生成金字塔的 MaskOverlay；未提供时第一次显示遮罩才生成
+        self.text_mask = text_mask
+        self.image_mask = image_mask
+        if overlay is None and text_mask is not None and image_mask is not None:
+            overlay = MaskOverlay(text_mask, image_mask)
+        self.mask_overlay = overlay
+
     def enhance_dpi(self):
         if not self.file_path:
             self.status_label.setText("Please select a TIF file first.")
@@ -244,137 +372,226 @@ class MainWindow(QMainWindow):
         target_dpi = int(self.dpi_spinbox.value())
         original_dpi = int(self.original_dpi)
         interpolation = self.interpolation_combo.currentText()
-
-        try:
-            dpi_enhancer = DPIEnhancer()
-            if self.text_mask is None or self.image_mask is None:
-                self.segment_image()
-            enhanced_image = dpi_enhancer.enhance(self.original_image, self.text_mask, self.image_mask, original_dpi, target_dpi, interpolation)
-
-            self.processed_image = enhanced_image
-            self.update_display()
-            self.save_button.setEnabled(True)
-            self.toggle_comparison_action.setEnabled(True)
-            self.status_label.setText(f"DPI enhanced from {self.original_dpi} to {target_dpi}. Click 'Save Enhanced Image' to save.")
-        except Exception as e:
-            self.status_label.setText(f"Error: {str(e)}")
+        sr_tier = self.sr_tier_combo.currentText().lower()
+
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText("Enhancing...")
+        self.jobs.submit("enhance", self.run_enhancement, self.original_image, self.text_mask, self.image_mask,
+                         original_dpi, target_dpi, interpolation, sr_tier,
+                         on_progress=self.on_job_progress,
+                         on_finished=self.on_enhance_finished,
+                         on_failed=self.on_enhance_failed,
+                         on_cancelled=self.on_enhance_cancelled)
+
+    def run_enhancement(self, report, image, text_mask, image_mask, original_dpi, target_dpi, interpolation, sr_tier):
+        # 在后台线程中执行，不能访问任何界面控件
+        if text_mask is None or image_mask is None:
+            report("segment")
+            text_mask, image_mask = self.segmenter.segment_and_refine(image)
+        enhanced_image = self.dpi_enhancer.enhance(image, text_mask, image_mask, original_dpi, target_dpi, interpolation,
+                                                   progress_callback=report, sr_tier=sr_tier,
+                                                   cancel_check=report)
+        overlay = MaskOverlay(text_mask, image_mask).prepare()
+        self.export_profile()
+        return text_mask, image_mask, overlay, target_dpi, enhanced_image
+
+    def export_profile(self):
+        # TIF_DPI_PROFILE=1 时每次增强后把记录写成 trace 文件并清空，不在内存中累积
+        profiler = self.dpi_enhancer.profiler
+        if not profiler.enabled:
+            return
+        spans = profiler.reset()
+        directory = os.path.join(DEFAULT_CACHE_DIR, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime('enhance_%Y%m%d_%H%M%S.json'))
+        profiler.to_chrome_trace(path, spans)
+        print(f"Profile written to {path}")
+
+    def on_job_progress(self, stage):
+        stage_names = {
+            "segment": "Segmenting image",
+            "ocr": "Running OCR",
+            "super-resolve": "Super-resolving image areas",
+            "merge": "Merging results",
+        }
+        self.status_label.setText(f"{stage_names.get(stage, stage)}...")
+
+    def on_enhance_finished(self, result):
+        text_mask, image_mask, overlay, target_dpi, enhanced_image = result
+        self.set_masks(text_mask, image_mask, overlay)
+        self.cancel_button.setEnabled(False)
+
+        # 按当前滑块参数的全分辨率渲染在后台执行，完成后再替换增强结果
+        self.preview_engine.set_base(enhanced_image)
+        self.preview_generation += 1
+        self.set_processed_image(None)
+        self.full_render_timer.stop()
+        self.start_full_render()
+        self.update_display()
+        self.update_info()
+        self.save_button.setEnabled(True)
+        self.toggle_comparison_action.setEnabled(True)
+        self.status_label.setText(f"DPI enhanced from {self.original_dpi} to {target_dpi}. Click 'Save Enhanced Image' to save.")
+
+    def on_enhance_failed(self, message):
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText(f"Error: {message}")
+
+    def on_enhance_cancelled(self):
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText("Enhancement cancelled.")
+
+    def cancel_enhancement(self):
+        self.jobs.cancel("enhance")
+
+    def current_adjustments(self):
+        return slider_params(self.sharpness_slider.value(), self.gamma_slider.value())
+
+    def schedule_enhance(self):
+        # 插值方式改变后重新增强，防抖避免连续切换时重复计算
+        if self.preview_engine.base_image is not None:
+            self.enhance_timer.start()
 
     def update_preview(self):
-        if not self.file_path or self.original_image is None:
+        if self.preview_engine.base_image is None:
             return
 
-        target_dpi = int(self.dpi_spinbox.value())
-        original_dpi = int(self.original_dpi)
-        interpolation = self.interpolation_combo.currentText()
-
-        try:
-            dpi_enhancer = DPIEnhancer()
-            if self.text_mask is None or self.image_mask is None:
-                self.segment_image()
-            enhanced_image = dpi_enhancer.enhance(self.original_image, self.text_mask, self.image_mask, original_dpi, target_dpi, interpolation)
-
-            self.processed_image = enhanced_image
-            self.update_display()
-            self.save_button.setEnabled(True)
-            self.toggle_comparison_action.setEnabled(True)
-            self.status_label.setText(f"DPI enhanced from {self.original_dpi} to {target_dpi}. Click 'Save Enhanced Image' to save.")
-        except Exception as e:
-            self.status_label.setText(f"Error: {str(e)}")
+        # 全分辨率结果防抖后在后台渲染，之前的结果从此过期
+        self.preview_generation += 1
+        self.full_render_timer.start()
 
-    def update_split_image(self):
-        if self.original_image is None:
+        # 在视口大小的代理图上立即渲染；对比模式下代理图显示在右侧
+        if self.image_label.show_comparison:
+            self.update_split_image()
             return
+        sharpness, gamma = self.current_adjustments()
+        preview = self.preview_engine.render_proxy(self.image_label.width(), self.image_label.height(), sharpness, gamma)
+        self.display_image(preview)
+        self.showing_preview = True
 
-        if self.processed_image is None or not self.image_label.show_comparison:
-            display_image = self.original_image.copy()
-        else:
-            left_image = self.original_image
-            right_image = self.processed_image
-
-            if left_image.shape != right_image.shape:
-                right_image = cv2.resize(right_image, (left_image.shape[1], left_image.shape[0]))
+    def start_full_render(self):
+        if self.preview_engine.base_image is None:
+            return
+        sharpness, gamma = self.current_adjustments()
+        generation = self.preview_generation
+        self.jobs.submit("preview", self.run_full_render, self.preview_engine.base_image, sharpness, gamma,
+                         on_finished=lambda result: self.on_full_render_finished(generation, *result),
+                         on_failed=self.on_job_failed)
+
+    def run_full_render(self, report, image, sharpness, gamma):
+        # 在后台线程中执行：渲染全分辨率结果，并生成显示金字塔的各级，界面线程只需缩放视口大小的图像
+        image = apply_adjustments(image, sharpness, gamma)
+        report("pyramid")
+        pyramid = DisplayPyramid(image)
+        pyramid.levels()
+        return image, pyramid
+
+    def on_full_render_finished(self, generation, image, pyramid):
+        # 忽略已经过期的渲染结果
+        if generation != self.preview_generation:
+            return
+        self.set_processed_image(image, pyramid)
+        self.processed_generation = generation
+        if self.image_label.show_comparison:
+            self.update_split_image()
 
-            height, width, channel = left_image.shape
-            split_width = int(width * self.image_label.split_ratio)
+    def on_job_failed(self, message):
+        self.status_label.setText(f"Error: {message}")
 
-            display_image = np.zeros((height, width, channel), dtype=np.uint8)
-            display_image[:, :split_width] = left_image[:, :split_width]
-            display_image[:, split_width:] = right_image[:, split_width:]
+    def update_split_image(self):
+        if self.original_pyramid is None:
+            return
 
-        if self.show_masks_action.isChecked() and self.text_mask is not None and self.image_mask is not None:
-            mask_overlay = np.zeros_like(display_image, dtype=np.uint8)
-            mask_overlay[self.text_mask > 0] = self.text_mask_color.getRgb()[:3]
-            mask_overlay[self.image_mask > 0] = self.image_mask_color.getRgb()[:3]
-            
-            alpha = 0.5  # 调整这个值来改变遮罩的透明度
-            display_image = cv2.addWeighted(display_image, 1, mask_overlay, alpha, 0)
+        # 所有合成都在视口大小的图像上进行，两侧的 pixmap 只在内容或视口改变时生成一次
+        width, height = self.original_pyramid.display_size(*self.viewport_size())
+        left_image = self.overlay_masks(self.original_pyramid.fit(width, height))
 
-        height, width, channel = display_image.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(display_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
+        if self.preview_engine.base_image is None or not self.image_label.show_comparison:
+            self.image_label.clear_comparison()
+            self.showing_preview = False
+            self.show_display_image(left_image)
+            return
 
-        self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+        # 增强结果与原图宽高比相同，缩放到同一显示尺寸；全分辨率渲染还没完成时右侧先显示代理图
+        if self.processed_pyramid is not None and self.processed_generation == self.preview_generation:
+            right_image = self.processed_pyramid.fit(width, height)
+        else:
+            proxy = self.preview_engine.render_proxy(width, height, *self.current_adjustments())
+            right_image = DisplayPyramid(proxy).fit(width, height)
+        right_image = self.overlay_masks(right_image)
+        self.showing_preview = False
+        self.image_label.set_comparison(to_pixmap(left_image), to_pixmap(right_image))
+
+    def overlay_masks(self, display_image):
+        if not self.show_masks_action.isChecked() or self.mask_overlay is None:
+            return display_image
+        # 遮罩颜色的透明度按覆盖率缩放，结果在掩码和颜色不变时直接取缓存
+        colors = (self.text_mask_color.getRgb(), self.image_mask_color.getRgb())
+        return self.mask_overlay.composite(display_image, colors)
 
     def save_enhanced_image(self):
-        if self.processed_image is None:
+        if self.preview_engine.base_image is None:
             self.status_label.setText("No enhanced image to save.")
             return
 
         file_dialog = QFileDialog()
         output_path, _ = file_dialog.getSaveFileName(self, "Save Enhanced Image", "", "TIF Files (*.tif *.tiff)")
         if output_path:
-            try:
-                dpi_enhancer = DPIEnhancer()
-                dpi_enhancer.save_image(self.processed_image, output_path, self.dpi_spinbox.value())
-                self.status_label.setText(f"Enhanced image saved as {output_path}")
-            except Exception as e:
-                self.status_label.setText(f"Error saving image: {str(e)}")
+            # 后台渲染尚未完成时在保存任务中按当前参数渲染，渲染和写文件都不占用界面线程
+            image = self.processed_image if self.processed_generation == self.preview_generation else None
+            self.status_label.setText("Saving...")
+            self.jobs.submit("save", self.run_save, image, self.preview_engine.base_image, self.current_adjustments(),
+                             output_path, self.dpi_spinbox.value(),
+                             on_finished=lambda path: self.status_label.setText(f"Enhanced image saved as {path}"),
+                             on_failed=lambda message: self.status_label.setText(f"Error saving image: {message}"))
+
+    def run_save(self, report, image, base_image, adjustments, output_path, dpi):
+        # 在后台线程中执行
+        if image is None:
+            image = apply_adjustments(base_image, *adjustments)
+        self.dpi_enhancer.save_image(image, output_path, dpi)
+        return output_path
 
     def toggle_masks(self):
         if self.original_image is not None:
-            if self.show_masks_action.isChecked():
+            if self.show_masks_action.isChecked() and (self.text_mask is None or self.image_mask is None):
                 self.segment_image()
-            self.update_display()
+            else:
+                self.update_display()
 
     def segment_image(self):
         if self.original_image is not None:
-            self.text_mask, self.image_mask = self.segmenter.segment_image(self.original_image)
-            # 使用颜色信息进一步细化掩码
-            self.text_mask, self.image_mask = self.segmenter.refine_masks(self.text_mask, self.image_mask, self.original_image)
-            self.status_label.setText("Image segmentation completed.")
+            self.status_label.setText("Segmenting image...")
+            self.jobs.submit("segment", self.run_segmentation, self.original_image,
+                             on_finished=self.on_segment_finished,
+                             on_failed=self.on_job_failed)
+
+    def run_segmentation(self, report, image):
+        report("segment")
+        # 分割并使用颜色信息进一步细化掩码，同一图像的结果会被缓存；遮罩的显示金字塔也在这里生成
+        text_mask, image_mask = self.segmenter.segment_and_refine(image)
+        return text_mask, image_mask, MaskOverlay(text_mask, image_mask).prepare()
+
+    def on_segment_finished(self, masks):
+        self.set_masks(*masks)
+        self.status_label.setText("Image segmentation completed.")
+        self.update_display()
 
     def update_display(self):
-        if self.original_image is None:
+        if self.original_pyramid is None:
             return
+        if self.image_label.show_comparison and self.preview_engine.base_image is not None:
+            # 对比模式下遮罩或颜色改变时重新生成两侧的 pixmap
+            self.update_split_image()
+            return
+        self.image_label.clear_comparison()
 
-        # 始终从原始图像开始
-        display_image = self.original_image.copy()
-
-        if self.show_masks_action.isChecked() and self.text_mask is not None and self.image_mask is not None:
-            # 创建一个与原始图像相同大小的 RGBA 图像用于遮罩
-            mask_overlay = np.zeros((*display_image.shape[:2], 4), dtype=np.uint8)
-            
-            # 为文字区域添加半透明遮罩
-            text_color = self.text_mask_color.getRgb()
-            mask_overlay[self.text_mask > 0] = (*text_color[:3], 64)  # 64 为四分之一透明度
-
-            # 为图像区域添加半透明遮罩
-            image_color = self.image_mask_color.getRgb()
-            mask_overlay[self.image_mask > 0] = (*image_color[:3], 64)  # 64 为四分之一透明度
-
-            # 将遮罩叠加到显示图像上
-            alpha_mask = mask_overlay[:,:,3] / 255.0
-            for c in range(3):  # 对每个颜色通道
-                display_image[:,:,c] = display_image[:,:,c] * (1 - alpha_mask) + mask_overlay[:,:,c] * alpha_mask
-
-        # 创建 QImage
-        height, width, channel = display_image.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(display_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
+        # 从缓存的降采样原图开始，只处理视口大小的数据
+        width, height = self.original_pyramid.display_size(*self.viewport_size())
+        display_image = self.overlay_masks(self.original_pyramid.fit(width, height))
 
-        self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+        self.showing_preview = False
+        self.show_display_image(display_image)
 
     def change_text_mask_color(self):
         color = QColorDialog.getColor(self.text_mask_color, self, "Choose Text Mask Color", QColorDialog.ColorDialogOption.ShowAlphaChannel)
@@ -389,6 +606,7 @@ class MainWindow(QMainWindow):
             self.update_display()
 
     def toggle_comparison(self):
-        if self.processed_image is not None:
+        # 全分辨率渲染还没完成时右侧先显示代理图，完成后 on_full_render_finished 会刷新对比视图
+        if self.preview_engine.base_image is not None:
             self.image_label.show_comparison = self.toggle_comparison_action.isChecked()
             self.update_split_image()
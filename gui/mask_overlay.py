@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from gui.display_pyramid import DisplayPyramid
+
+
+class MaskOverlay:
+    # 文字/图像掩码的叠加显示。掩码按显示尺寸缩小后预先算好预乘颜色层和剩余权重，
+    # 叠加只需一次整数乘法和一次饱和加法；结果按（显示图像、颜色）缓存，
+    # 只有掩码（新建 MaskOverlay）、颜色或显示尺寸改变时才重新计算
+    def __init__(self, text_mask, image_mask, max_cached=4):
+        self.pyramids = (DisplayPyramid(text_mask), DisplayPyramid(image_mask))
+        self.max_cached = max_cached
+        self._layers = OrderedDict()
+        self._composites = OrderedDict()
+
+    def prepare(self):
+        # 生成两个掩码金字塔的各级，在后台任务中调用，界面线程第一次显示遮罩时只需缩放到显示尺寸
+        for pyramid in self.pyramids:
+            pyramid.levels()
+        return self
+
+    def layers(self, width, height, colors):
+        # colors 为每个掩码的 (r, g, b, a)；返回预乘颜色层和原图的剩余权重（0-255）
+        key = (width, height, colors)
+        layers = self._layers.get(key)
+        if layers is not None:
+            self._layers.move_to_end(key)
+            return layers
+
+        premultiplied = np.zeros((height, width, 3), dtype=np.uint8)
+        weight = np.full((height, width, 3), 255, dtype=np.uint8)
+        levels = np.arange(256, dtype=np.float32)
+        for pyramid, (r, g, b, a) in zip(self.pyramids, colors):
+            # 缩小后的掩码值是覆盖率，透明度按覆盖率缩放；两个掩码重叠时后一个覆盖前一个
+            mask = pyramid.fit(width, height)
+            alpha = levels * (a / 255.0)
+            color_lut = np.rint(np.stack([alpha * (c / 255.0) for c in (r, g, b)], axis=1)).astype(np.uint8)
+            weight_lut = np.repeat(np.rint(255.0 - alpha).astype(np.uint8)[:, np.newaxis], 3, axis=1)
+            covered = cv2.compare(mask, 0, cv2.CMP_GT)
+            coverage = cv2.merge([mask] * 3)
+            cv2.copyTo(cv2.LUT(coverage, color_lut[np.newaxis]), covered, premultiplied)
+            cv2.copyTo(cv2.LUT(coverage, weight_lut[np.newaxis]), covered, weight)
+
+        layers = (premultiplied, weight)
+        self._layers[key] = layers
+        self._trim(self._layers)
+        return layers
+
+    def composite(self, display_image, colors):
+        # display_image 来自 DisplayPyramid.fit，同一尺寸会返回同一个数组，可以按对象缓存
+        key = (id(display_image), colors)
+        entry = self._composites.get(key)
+        if entry is not None and entry[0] is display_image:
+            self._composites.move_to_end(key)
+            return entry[1]
+
+        height, width = display_image.shape[:2]
+        premultiplied, weight = self.layers(width, height, colors)
+        result = cv2.multiply(display_image, weight, scale=1 / 255.0)
+        cv2.add(result, premultiplied, dst=result)
+
+        # 保留原数组的引用，避免 id 被新数组复用时取到旧结果
+        self._composites[key] = (display_image, result)
+        self._trim(self._composites)
+        return result
+
+    def _trim(self, cache):
+        while len(cache) > self.max_cached:
+            cache.popitem(last=False)
@@ -0,0 +1,48 @@
+import cv2
+
+from utils.image_utils import adjust_gamma, sharpen_image
+
+
+def slider_params(sharpness_value, gamma_value):
+    # 滑块值 -> (锐化强度, gamma)
+    return sharpness_value / 50.0, max(gamma_value, 1) / 100.0
+
+
+def apply_adjustments(image, sharpness, gamma):
+    result = image
+    if gamma != 1.0:
+        result = adjust_gamma(result, gamma)
+    if sharpness > 0:
+        result = sharpen_image(result, sharpness)
+    return result
+
+
+class PreviewEngine:
+    # 两级预览：先在视口大小的代理图上即时渲染，再在后台渲染全分辨率结果
+    def __init__(self):
+        self.base_image = None
+        self._proxy = None
+        self._proxy_viewport = None
+
+    def set_base(self, image):
+        # 缓存增强后的结果，滑块只在其基础上做 gamma/锐化
+        self.base_image = image
+        self._proxy = None
+        self._proxy_viewport = None
+
+    def proxy(self, viewport_width, viewport_height):
+        viewport = (max(viewport_width, 1), max(viewport_height, 1))
+        if self._proxy is None or self._proxy_viewport != viewport:
+            height, width = self.base_image.shape[:2]
+            ratio = min(viewport[0] / width, viewport[1] / height, 1.0)
+            if ratio < 1.0:
+                size = (max(int(width * ratio), 1), max(int(height * ratio), 1))
+                self._proxy = cv2.resize(self.base_image, size, interpolation=cv2.INTER_AREA)
+            else:
+                self._proxy = self.base_image
+            self._proxy_viewport = viewport
+        return self._proxy
+
+    def render_proxy(self, viewport_width, viewport_height, sharpness, gamma):
+        return apply_adjustments(self.proxy(viewport_width, viewport_height), sharpness, gamma)
+
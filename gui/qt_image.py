@@ -0,0 +1,22 @@
+import numpy as np
+from PyQt6.QtGui import QImage, QPixmap
+
+
+def to_qimage(image):
+    # 直接包装 numpy 缓冲区，不复制像素。QImage 不拥有这块内存，
+    # 调用方必须在 QImage（及由它绘制的内容）使用期间保持数组存活
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    if image.ndim == 2:
+        image_format = QImage.Format.Format_Grayscale8
+    elif image.shape[2] == 4:
+        image_format = QImage.Format.Format_RGBA8888
+    else:
+        image_format = QImage.Format.Format_RGB888
+    return QImage(image.data, width, height, image.strides[0], image_format), image
+
+
+def to_pixmap(image):
+    # QPixmap.fromImage 会复制一次，只应对视口大小的图像调用
+    q_image, _ = to_qimage(image)
+    return QPixmap.fromImage(q_image)
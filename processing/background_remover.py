@@ -6,6 +6,8 @@ LastEditTime: 2024-10-14 20:05:25
 FilePath: /TIFF DPI Enhancer/processing/background_remover.py
 Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查看配置 进行设置: https://github.com/OBKoro1/koro1FileHeader/wiki/%E9%85%8D%E7%BD%AE
 '''
+import math
+
 import cv2
 import numpy as np
 
@@ -18,4 +20,27 @@ class BackgroundRemover:
         kernel = np.ones((3,3), np.uint8)
         mask = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel, iterations=2)
         
-        return mask
\ No newline at end of file
+        return mask
+
+    def content_bbox(self, image, padding=0, max_dimension=1024, min_area=4):
+        # 在降采样的副本上求前景的外接矩形，返回原图坐标 (x0, y0, x1, y1)；没有内容时返回 None。
+        # 面积小于 min_area（降采样后的像素）的连通区域视为噪点，不计入内容
+        height, width = image.shape[:2]
+        ratio = min(max_dimension / max(width, height), 1.0)
+        if ratio < 1.0:
+            image = cv2.resize(image, (max(int(width * ratio), 1), max(int(height * ratio), 1)),
+                               interpolation=cv2.INTER_AREA)
+        mask = self.remove_background(image)
+
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= min_area]
+        if len(stats) == 0:
+            return None
+        x0 = stats[:, cv2.CC_STAT_LEFT].min()
+        y0 = stats[:, cv2.CC_STAT_TOP].min()
+        x1 = (stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]).max()
+        y1 = (stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]).max()
+
+        # 映射回原图坐标，向外取整并加上边距
+        return (max(int(x0 / ratio) - padding, 0), max(int(y0 / ratio) - padding, 0),
+                min(math.ceil(x1 / ratio) + padding, width), min(math.ceil(y1 / ratio) + padding, height))
@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from processing.tif_reader import TIFReader
+from processing.dpi_enhancer import DPIEnhancer
+from processing.execution_settings import DNN_BACKENDS, DNN_TARGETS, ExecutionSettings
+from processing.model_registry import get_registry
+from processing.scale_planner import SR_TIER_CHOICES, SR_TIERS, ScalePlanner
+from processing.tif_writer import BILEVEL_COMPRESSIONS
+from utils.cache_utils import TieredCache
+from utils.profiler import Profiler
+
+TIF_EXTENSIONS = ('.tif', '.tiff')
+PROGRESS_FILE = '.batch_progress.jsonl'
+TRACE_FILE = 'batch_trace.json'
+
+# 每个工作进程一个增强器，模型在第一次用到时加载一次
+_enhancer = None
+
+
+def _init_worker(cache_dir=None, profile_origin=None, sr_tier='quality', time_budget=None, execution=None,
+                 crop_to_content=False):
+    global _enhancer
+    # profile_origin 为 None 时不做性能分析；否则所有进程使用同一个时间起点
+    profiler = Profiler(enabled=profile_origin is not None, origin=profile_origin)
+    # 进程池已经占满所有核心，每个进程内的 OCR 不再并行
+    _enhancer = DPIEnhancer(ocr_workers=1, cache_dir=cache_dir, profiler=profiler, sr_tier=sr_tier,
+                            time_budget=time_budget, execution=execution, crop_to_content=crop_to_content)
+    if cache_dir:
+        # 磁盘缓存让重复运行的批处理跳过分割和 OCR
+        _enhancer.segmenter.cache = TieredCache(max_entries=2, cache_dir=os.path.join(cache_dir, 'segmentation'))
+    else:
+        # 每个文件只处理一次，进程内共享的缓存不会命中，只会让每个进程多占几页的掩码内存
+        _enhancer.segmenter.cache = TieredCache(max_entries=1)
+        _enhancer.ocr.cache = TieredCache(max_entries=1)
+
+
+def check_models(sr_tier, time_budget=None):
+    # 在父进程中检查 quality 档位至少有一个模型文件；其他档位缺少模型时会退回更快的模型或插值
+    registry = get_registry()
+    planner = ScalePlanner(registry, tier=sr_tier, time_budget=time_budget)
+    if sr_tier == 'quality' and not planner.available_models(SR_TIERS['quality']) \
+            and not registry.is_available(*planner.fallback):
+        raise FileNotFoundError(f"No super-resolution model for --sr-tier quality: "
+                                f"{registry.model_path(*planner.fallback)} not found. "
+                                f"Add the model file or choose another --sr-tier.")
+
+
+def find_tif_files(input_dir, recursive=False):
+    files = []
+    for root, dirs, names in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.lower().endswith(TIF_EXTENSIONS):
+                files.append(os.path.relpath(os.path.join(root, name), input_dir))
+        if not recursive:
+            break
+    return files
+
+
+def job_params(target_dpi, interpolation, bilevel, sr_tier, crop_to_content):
+    # 影响输出的参数，写进每条进度记录；续跑时只跳过参数相同的文件
+    return {'target_dpi': target_dpi, 'interpolation': interpolation, 'bilevel': bilevel, 'sr_tier': sr_tier,
+            'crop_to_content': crop_to_content}
+
+
+def is_done(record, params):
+    # 旧版本的进度记录没有这些参数，按未完成处理
+    if record is None or any(record.get(name) != value for name, value in params.items()):
+        return False
+    return all(os.path.exists(path) for path in record.get('outputs', []))
+
+
+def load_progress(progress_path):
+    # 读取已完成的文件，用于断点续跑；同一文件以最后一条记录为准
+    done = {}
+    if not os.path.exists(progress_path):
+        return done
+    with open(progress_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 进程被中断时最后一行可能不完整
+                continue
+            if record.get('status') == 'ok':
+                done[record['file']] = record
+            else:
+                # 用其他参数重新处理失败时，之前成功的输出已经不对应当前参数
+                done.pop(record.get('file'), None)
+    return done
+
+
+def page_output_path(output_path, page, page_count):
+    # 多页 TIFF 的每一页单独输出为 <name>_p0001.tif
+    if page_count == 1:
+        return output_path
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_p{page + 1:04d}{ext}"
+
+
+def process_file(task):
+    rel_path, input_path, output_path, target_dpi, interpolation, bilevel = task
+    record = {'file': rel_path, 'outputs': [], 'pid': os.getpid()}
+    stages = {}
+    start = time.perf_counter()
+
+    def add_stage(name, stage_start):
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - stage_start
+
+    try:
+        reader = TIFReader(input_path)
+        page_count = reader.page_count
+        pages = []
+
+        # 逐页读取和处理，多页文件任意时刻也只有一页在内存中
+        stage_start = time.perf_counter()
+        for page, image in reader.iter_pages():
+            add_stage('read', stage_start)
+            original_dpi = int(page.dpi)
+
+            # 按本页的计划加载模型（每个进程只加载一次），加载失败时记录在本文件的结果中
+            plan = _enhancer.planner.plan(image.shape[1], image.shape[0], target_dpi / original_dpi)
+            if plan.uses_model and not _enhancer.registry.get(*plan.model).loaded:
+                stage_start = time.perf_counter()
+                _enhancer.registry.preload(*plan.model)
+                add_stage('load-model', stage_start)
+
+            # 裁剪到内容区域时由增强器只对裁剪区域做分割，耗时计入 enhance
+            text_mask = image_mask = None
+            if not _enhancer.crop_to_content:
+                stage_start = time.perf_counter()
+                with _enhancer.profiler.span("segmentation", file=rel_path, page=page.index):
+                    text_mask, image_mask = _enhancer.segmenter.segment_and_refine(image)
+                add_stage('segment', stage_start)
+
+            stage_start = time.perf_counter()
+            enhanced_image = _enhancer.enhance(image, text_mask, image_mask, original_dpi, target_dpi, interpolation,
+                                               bilevel=bilevel is not None)
+            add_stage('enhance', stage_start)
+
+            stage_start = time.perf_counter()
+            page_path = page_output_path(output_path, page.index, page_count)
+            os.makedirs(os.path.dirname(page_path) or '.', exist_ok=True)
+            # 先写临时文件再重命名，避免中断时留下损坏的输出
+            base, ext = os.path.splitext(page_path)
+            tmp_path = base + '.part' + ext
+            _enhancer.save_image(enhanced_image, tmp_path, target_dpi, compression=bilevel)
+            os.replace(tmp_path, page_path)
+            add_stage('save', stage_start)
+
+            record['outputs'].append(page_path)
+            pages.append({
+                'page': page.index,
+                'original_dpi': original_dpi,
+                'input_shape': list(image.shape),
+                'output_shape': list(enhanced_image.shape),
+                'sr_plan': repr(_enhancer.last_plan),
+                'content_crop': _enhancer.last_crop,
+            })
+            del image, text_mask, image_mask, enhanced_image
+            stage_start = time.perf_counter()
+
+        record.update({'status': 'ok', 'target_dpi': target_dpi, 'pages': pages})
+    except Exception as e:
+        record.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    record['stages'] = {name: round(seconds, 4) for name, seconds in stages.items()}
+    if _enhancer.profiler.enabled:
+        record['profile'] = _enhancer.profiler.summary()
+        # 明细只用于合并 trace，写进度文件前会去掉
+        record['spans'] = _enhancer.profiler.reset()
+    return record
+
+
+def build_summary(records, skipped, workers, wall_seconds):
+    ok = [r for r in records if r['status'] == 'ok']
+    failed = [r for r in records if r['status'] != 'ok']
+    busy_seconds = sum(r['seconds'] for r in records)
+    stage_totals = {}
+    for r in ok:
+        for name, seconds in r['stages'].items():
+            stage_totals[name] = round(stage_totals.get(name, 0.0) + seconds, 4)
+
+    return {
+        'processed': len(records),
+        'succeeded': len(ok),
+        'failed': len(failed),
+        'skipped': skipped,
+        'workers': workers,
+        'wall_seconds': round(wall_seconds, 4),
+        'busy_seconds': round(busy_seconds, 4),
+        'mean_seconds_per_file': round(busy_seconds / len(records), 4) if records else 0.0,
+        'files_per_second': round(len(records) / wall_seconds, 4) if wall_seconds > 0 else 0.0,
+        'stage_totals': stage_totals,
+        'errors': [{'file': r['file'], 'error': r['error']} for r in failed],
+        'files': records,
+    }
+
+
+def run_batch(input_dir, output_dir, target_dpi, workers=None, interpolation='Lanczos',
+              recursive=False, resume=True, summary_path=None, cache_dir=None, profile=False,
+              sr_tier='quality', time_budget=None, threads_per_worker=None, dnn_backend='default', dnn_target='cpu',
+              bilevel=None, crop_to_content=False):
+    workers = workers or os.cpu_count() or 1
+    check_models(sr_tier, time_budget)
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, PROGRESS_FILE)
+
+    if not resume and os.path.exists(progress_path):
+        os.remove(progress_path)
+    done = load_progress(progress_path)
+    params = job_params(target_dpi, interpolation, bilevel, sr_tier, crop_to_content)
+
+    tasks = []
+    skipped = 0
+    for rel_path in find_tif_files(input_dir, recursive):
+        output_path = os.path.join(output_dir, os.path.splitext(rel_path)[0] + '.tif')
+        if is_done(done.get(rel_path), params):
+            skipped += 1
+            continue
+        tasks.append((rel_path, os.path.join(input_dir, rel_path), output_path, target_dpi, interpolation, bilevel))
+
+    total = len(tasks)
+    # 每个工作进程的 OpenCV 线程数默认是 CPU 核数 / 进程数
+    execution = ExecutionSettings.for_workers(min(workers, total) or 1, threads_per_worker,
+                                              dnn_backend=dnn_backend, dnn_target=dnn_target)
+    print(f"{total} files to process, {skipped} already done, {workers} workers", file=sys.stderr)
+
+    records = []
+    spans = []
+    start = time.perf_counter()
+    profile_origin = start if profile else None
+    with open(progress_path, 'a', encoding='utf-8') as progress:
+        def handle(record):
+            spans.extend(record.pop('spans', []))
+            record.update(params)
+            records.append(record)
+            progress.write(json.dumps(record) + '\n')
+            progress.flush()
+            message = f"[{len(records)}/{total}] {record['file']} {record['status']} {record['seconds']:.2f}s"
+            if record['status'] != 'ok':
+                message += f" ({record['error']})"
+            print(message, file=sys.stderr)
+
+        if workers == 1:
+            _init_worker(cache_dir, profile_origin, sr_tier, time_budget, execution, crop_to_content)
+            for task in tasks:
+                handle(process_file(task))
+        elif tasks:
+            with Pool(processes=min(workers, total), initializer=_init_worker,
+                      initargs=(cache_dir, profile_origin, sr_tier, time_budget, execution, crop_to_content)) as pool:
+                for record in pool.imap_unordered(process_file, tasks):
+                    handle(record)
+
+    summary = build_summary(records, skipped, workers, time.perf_counter() - start)
+    execution.resolve()
+    summary['execution'] = execution.to_dict()
+    # 父进程没有调用 apply，它的 OpenCV 线程数没有意义
+    summary['execution'].pop('opencv_threads')
+    summary_path = summary_path or os.path.join(output_dir, 'batch_summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    if profile:
+        # 所有工作进程的阶段合并成一个 Chrome trace，可在 chrome://tracing 或 Perfetto 中查看
+        trace = Profiler(enabled=True, origin=start)
+        trace.metadata.update({'workers': workers, 'target_dpi': target_dpi, 'interpolation': interpolation,
+                               'sr_tier': sr_tier, 'execution': summary['execution']})
+        trace.to_chrome_trace(os.path.join(output_dir, TRACE_FILE), spans)
+
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Enhance the DPI of every TIF file in a directory.")
+    parser.add_argument('input_dir', help="Directory containing the source TIF files")
+    parser.add_argument('output_dir', help="Directory the enhanced TIF files are written to")
+    parser.add_argument('--target-dpi', type=int, default=300, help="Target DPI (default: 300)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--interpolation', default='Lanczos', choices=['Nearest', 'Bilinear', 'Bicubic', 'Lanczos'])
+    parser.add_argument('--sr-tier', default='quality', choices=SR_TIER_CHOICES,
+                        help="Super-resolution quality/speed tier: quality (EDSR), balanced (LapSRN/FSRCNN), "
+                             "fast (FSRCNN/ESPCN), draft (interpolation only) or auto (default: quality)")
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help="Per-page super-resolution time budget in seconds used by --sr-tier auto")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="OpenCV threads in each worker process (default: CPU count / workers)")
+    parser.add_argument('--dnn-backend', default='default', choices=sorted(DNN_BACKENDS),
+                        help="OpenCV DNN backend for super-resolution models (default: default)")
+    parser.add_argument('--dnn-target', default='cpu', choices=sorted(DNN_TARGETS),
+                        help="OpenCV DNN target device (default: cpu)")
+    parser.add_argument('--bilevel', default=None, choices=list(BILEVEL_COMPRESSIONS),
+                        help="Write 1-bit tiled TIFFs with this compression instead of RGB "
+                             "(group4 or lzw need Pillow built with libtiff)")
+    parser.add_argument('--crop-to-content', action='store_true',
+                        help="Only segment, OCR and super-resolve the padded content bounding box of each page; "
+                             "the area saved per page is reported in the summary")
+    parser.add_argument('--recursive', action='store_true', help="Also process sub-directories")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="Ignore the progress file and process every file again")
+    parser.add_argument('--summary', default=None,
+                        help="Path of the JSON summary (default: <output_dir>/batch_summary.json)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Directory for cached segmentation masks and OCR results, reused across runs")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"Record per-stage timing and memory, written to the summary and <output_dir>/{TRACE_FILE}")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        summary = run_batch(args.input_dir, args.output_dir, args.target_dpi, workers=args.workers,
+                            interpolation=args.interpolation, recursive=args.recursive,
+                            resume=args.resume, summary_path=args.summary, cache_dir=args.cache_dir,
+                            profile=args.profile, sr_tier=args.sr_tier, time_budget=args.time_budget,
+                            threads_per_worker=args.threads_per_worker, dnn_backend=args.dnn_backend,
+                            dnn_target=args.dnn_target, bilevel=args.bilevel,
+                            crop_to_content=args.crop_to_content)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"Done: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+          f"{summary['skipped']} skipped in {summary['wall_seconds']:.1f}s", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
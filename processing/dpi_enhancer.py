@@ -6,135 +6,277 @@ LastEditTime: 2024-10-16 21:43:35
 FilePath: /TIFF DPI Enhancer/processing/dpi_enhancer.py
 Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查看配置 进行设置: https://github.com/OBKoro1/koro1FileHeader/wiki/%E9%85%8D%E7%BD%AE%E8%AE%BE%E7%BD%AE
 '''
+import math
+import os
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import pytesseract
+from PIL import Image, ImageDraw
+from processing.background_remover import BackgroundRemover
+from processing.execution_settings import ExecutionSettings
+from processing.font_manager import FontManager
 from processing.image_segmentation import ImageSegmenter
+from processing.model_registry import get_registry
+from processing.ocr_runner import OCRRunner
+from processing.scale_planner import ScalePlanner, interpolation_flag
+from processing.tif_writer import BilevelImage, BilevelTIFWriter, pack_rows
+from processing.tiled_upscaler import TiledUpscaler
+from utils.cache_utils import TieredCache, content_hash
+from utils.image_utils import mask_bounding_boxes, resize_rows
+from utils.profiler import array_stats, get_profiler
 
 class DPIEnhancer:
-    def __init__(self): 
-        self.sr = cv2.dnn_superres.DnnSuperResImpl_create()
-        self.sr.readModel("models/EDSR_x4.pb")
-        self.sr.setModel("edsr", 4)
+    def __init__(self, tile_size=256, tile_halo=16, region_padding=16, max_region_coverage=0.6, registry=None, ocr_workers=None,
+                 cache_dir=None, font_path=None, profiler=None, sr_tier='quality', time_budget=None, execution=None,
+                 band_height=256, keep_intermediates=False, intermediate_bytes=1024 * 1024 * 1024,
+                 crop_to_content=False, content_padding=32, min_crop_saving=0.05): 
+        # 模型由注册表按进程共享，第一次超分辨率时才加载
+        self.registry = registry or get_registry()
+        self.sr = self.registry.get("edsr", 4)
         self.segmenter = ImageSegmenter()
+        # 分块超分辨率，峰值内存只取决于分块大小而不是整页大小
+        self.upscaler = TiledUpscaler(self.sr, scale=4, tile_size=tile_size, halo=tile_halo)
+        self.tile_size = tile_size
+        self.tile_halo = tile_halo
+        # 按缩放比例和质量档位选择模型（或不用模型），保证只做一次最终插值；
+        # sr_tier 为 auto 时按页面大小和 time_budget（秒）自动选择
+        self.planner = ScalePlanner(self.registry, tier=sr_tier, time_budget=time_budget)
+        self.last_plan = None
+        self._upscalers = {}
+        # 只对图像掩码的连通区域做超分辨率；区域覆盖率超过该比例时直接整页分块处理
+        self.region_padding = region_padding
+        self.max_region_coverage = max_region_coverage
+        # 按文本块并行 OCR；指定 cache_dir 时识别结果持久化到磁盘，换目标 DPI 重新渲染时不再调用 tesseract
+        ocr_cache = TieredCache(max_entries=64, cache_dir=os.path.join(cache_dir, 'ocr')) if cache_dir else None
+        self.ocr = OCRRunner(max_workers=ocr_workers, cache=ocr_cache)
+        self.fonts = FontManager(font_path)
+        # 阶段耗时/内存分析，默认关闭
+        self.profiler = profiler or get_profiler()
+        # 线程数和 DNN 后端/目标；未指定时沿用 OpenCV 的默认设置，不影响进程内其他增强器共享的模型
+        self.execution = execution or ExecutionSettings()
+        self.execution.apply()
+        if execution is not None:
+            self.registry.configure(execution)
+        self.profiler.metadata['execution'] = self.execution.to_dict()
+        # 合并/阈值阶段按行带处理的高度（输出像素）
+        self.band_height = band_height
+        # 保留与目标 DPI 无关的中间结果（OCR 单词框、模型原始倍率的输出），
+        # 同一页只改目标 DPI 时只重做插值和文字渲染；批处理每页只处理一次，默认不保留
+        self.intermediate_bytes = intermediate_bytes
+        self.intermediates = TieredCache(max_entries=4, max_bytes=intermediate_bytes) if keep_intermediates else None
+        # 可选的预处理：只对内容外接矩形（加 content_padding 像素边距）做分割/OCR/超分辨率，再贴回目标尺寸的空白画布；
+        # 省下的面积比例小于 min_crop_saving 时仍处理整页
+        self.crop_to_content = crop_to_content
+        self.content_padding = content_padding
+        self.min_crop_saving = min_crop_saving
+        self.background = BackgroundRemover()
+        self.last_crop = None
 
-    def enhance(self, image, content_mask, original_dpi, target_dpi, interpolation_method):
-        # 图像分割
-        text_mask, image_mask = self.segmenter.segment_image(image)
-        
-        print(f"Original image shape: {image.shape}")
-        print(f"Text mask shape: {text_mask.shape}")
-        print(f"Image mask shape: {image_mask.shape}")
+    def enhance(self, image, text_mask, image_mask, original_dpi, target_dpi, interpolation_method, progress_callback=None,
+                sr_tier=None, bilevel=False, cancel_check=None):
+        # progress_callback(stage) 在每个阶段开始前调用，可以通过抛出异常来取消处理；
+        # cancel_check() 在阶段内的分块、行带和 OCR 文本块之间调用，同样通过抛出异常取消；
+        # bilevel 为 True 时返回按位打包的 BilevelImage 而不是 3 通道数组
+        args = (original_dpi, target_dpi, interpolation_method, progress_callback, sr_tier, bilevel, cancel_check)
+        self.last_crop = None
+        if not self.crop_to_content:
+            return self.enhance_page(image, text_mask, image_mask, *args)
 
-        # 计算缩放因子
         scale_factor = target_dpi / original_dpi
+        with self.profiler.span("crop"):
+            box = self.content_box(image, scale_factor)
+            self.profiler.annotate(**self.last_crop)
+        if box is None:
+            return self.enhance_page(image, text_mask, image_mask, *args)
+
+        x0, y0, x1, y1 = box
+        crop = lambda array: None if array is None else np.ascontiguousarray(array[y0:y1, x0:x1])
+        enhanced = self.enhance_page(crop(image), crop(text_mask), crop(image_mask), *args) if x1 > x0 else None
+        return self.paste_content(enhanced, box, image.shape, scale_factor, bilevel)
+
+    def content_box(self, image, scale_factor):
+        # 内容外接矩形，不值得裁剪时返回 None；空白页返回空矩形。结果记录在 last_crop 中
+        height, width = image.shape[:2]
+        box = self.background.content_bbox(image, padding=self.content_padding)
+        if box is None:
+            box = (0, 0, 0, 0)
+        else:
+            # 比例为 p/q 时，起点对齐到 q 的整数倍，裁剪结果的像素网格才与整页结果重合；
+            # 左边界在输出中还要是 8 像素的整数倍，1 位打包的结果可以按字节贴回画布。终点同样对齐到 q
+            ratio = Fraction(scale_factor).limit_denominator()
+            q = ratio.denominator
+            x_step = q * 8 // math.gcd(ratio.numerator, 8)
+            x0, y0, x1, y1 = box
+            box = (x0 // x_step * x_step, y0 // q * q, min(-(-x1 // q) * q, width), min(-(-y1 // q) * q, height))
+
+        kept = (box[2] - box[0]) * (box[3] - box[1]) / (width * height)
+        applied = 1.0 - kept >= self.min_crop_saving
+        self.last_crop = {'box': list(box), 'page_size': [width, height], 'kept_fraction': round(kept, 4),
+                          'saved_fraction': round(1.0 - kept, 4) if applied else 0.0, 'applied': applied}
+        return box if applied else None
+
+    def paste_content(self, enhanced, box, image_shape, scale_factor, bilevel=False):
+        # 把裁剪区域的结果贴回目标尺寸的画布。整页处理时内容以外的像素合并、阈值化后都是 0，画布同样填 0
+        height, width = image_shape[:2]
+        out_width, out_height = int(width * scale_factor), int(height * scale_factor)
+        # 起点已对齐，用分数计算避免浮点误差
+        ratio = Fraction(scale_factor).limit_denominator()
+        tx0, ty0 = box[0] * ratio.numerator // ratio.denominator, box[1] * ratio.numerator // ratio.denominator
+
+        if bilevel:
+            canvas = BilevelImage(out_width, out_height, np.zeros((out_height, (out_width + 7) // 8), dtype=np.uint8))
+            if out_width % 8:
+                # 与 pack_rows 一致，行尾补齐的位为白色
+                canvas.data[:, -1] = 0xFF >> (out_width % 8)
+            if enhanced is not None:
+                rows = canvas.data[ty0:ty0 + enhanced.height, tx0 // 8:tx0 // 8 + enhanced.data.shape[1]]
+                remainder = enhanced.width % 8
+                if remainder and tx0 + enhanced.width < out_width:
+                    # 裁剪结果行尾的补齐位落在画布内部，只保留属于结果的位
+                    keep = (0xFF << (8 - remainder)) & 0xFF
+                    rows[:, :-1] = enhanced.data[:, :-1]
+                    rows[:, -1] = (enhanced.data[:, -1] & keep) | (rows[:, -1] & (keep ^ 0xFF))
+                else:
+                    rows[:] = enhanced.data
+            return canvas
+
+        canvas = np.zeros((out_height, out_width, 3), dtype=np.uint8)
+        if enhanced is not None:
+            canvas[ty0:ty0 + enhanced.shape[0], tx0:tx0 + enhanced.shape[1]] = enhanced
+        return canvas
+
+    def enhance_page(self, image, text_mask, image_mask, original_dpi, target_dpi, interpolation_method,
+                     progress_callback=None, sr_tier=None, bilevel=False, cancel_check=None):
+        report = progress_callback or (lambda stage: None)
+        profiler = self.profiler
+
+        # 图像分割（和界面、批处理一样使用细化后的掩码），调用方已经计算过掩码时直接复用
+        if text_mask is None or image_mask is None:
+            report("segment")
+            with profiler.span("segmentation"):
+                text_mask, image_mask = self.segmenter.segment_and_refine(image)
+
+        # 中间结果按页面内容和掩码缓存
+        page_key = content_hash(image, text_mask, image_mask) if self.intermediates is not None else None
 
         # 对文字区域进行OCR和重新渲染
-        enhanced_text = self.enhance_text_with_ocr(image, text_mask, original_dpi, target_dpi)
-        print(f"Enhanced text shape: {enhanced_text.shape}")
-        print(f"Enhanced text dtype: {enhanced_text.dtype}")
-        print(f"Enhanced text min-max values: {enhanced_text.min()}-{enhanced_text.max()}")
-
-        # 对图像区域进行增强
-        enhanced_image_area = self.enhance_image_area(image, image_mask, original_dpi, target_dpi)
-        print(f"Enhanced image area shape: {enhanced_image_area.shape}")
-        print(f"Enhanced image area dtype: {enhanced_image_area.dtype}")
-        print(f"Enhanced image area min-max values: {enhanced_image_area.min()}-{enhanced_image_area.max()}")
-
-        # 确保两个图像具有相同的尺寸
-        if enhanced_text.shape != enhanced_image_area.shape:
-            enhanced_text = cv2.resize(enhanced_text, (enhanced_image_area.shape[1], enhanced_image_area.shape[0]))
-
-        # 合并增强后的区域
-        enhanced_image = cv2.addWeighted(enhanced_text, 1, enhanced_image_area, 1, 0)
-        
-        # 应用阈值，将灰色区域转换为黑白
-        _, enhanced_image = cv2.threshold(enhanced_image, 128, 255, cv2.THRESH_BINARY)
-
-        print(f"Combined enhanced image shape: {enhanced_image.shape}")
-        print(f"Combined enhanced image dtype: {enhanced_image.dtype}")
-        print(f"Combined enhanced image min-max values: {enhanced_image.min()}-{enhanced_image.max()}")
-
-        # 检查是否有全白的情况
-        if np.all(enhanced_image == 255):
-            print("Warning: The enhanced image is all white!")
-
-        # 如果需要进一步缩放以达到目标DPI
-        if scale_factor != 4:  # EDSR模型是4倍放大
-            height, width = enhanced_image.shape[:2]
-            new_height = int(height * (scale_factor / 4))
-            new_width = int(width * (scale_factor / 4))
-            enhanced_image = cv2.resize(enhanced_image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+        report("ocr")
+        enhanced_text = self.enhance_text_with_ocr(image, text_mask, original_dpi, target_dpi, page_key,
+                                                   cancel_check)
+
+        # 对图像区域进行增强，直接输出目标尺寸
+        report("super-resolve")
+        enhanced_image_area = self.enhance_image_area(image, image_mask, original_dpi, target_dpi, interpolation_method,
+                                                      sr_tier, page_key, cancel_check)
+
+        # 按行带合并、阈值化，结果直接写回图像区域的缓冲区（或逐行带打包成 1 位）
+        report("merge")
+        with profiler.span("merge", fused="merge+threshold", bilevel=bilevel):
+            enhanced_image, all_white = self.merge_bands(enhanced_text, enhanced_image_area, bilevel)
+            del enhanced_text, enhanced_image_area
+
+            # 检查是否有全白的情况
+            if all_white:
+                print("Warning: The enhanced image is all white!")
+
+            if profiler.enabled:
+                profiler.annotate(**array_stats(enhanced_image.data if bilevel else enhanced_image))
 
         return enhanced_image
 
-    def enhance_text_with_ocr(self, image, text_mask, original_dpi, target_dpi):
-        # 对文字区域应用OCR
-        text_area = cv2.bitwise_and(image, image, mask=text_mask)
-        gray_text = cv2.cvtColor(text_area, cv2.COLOR_BGR2GRAY)
-        
-        print(f"Text area shape: {text_area.shape}")
-        print(f"Gray text shape: {gray_text.shape}")
-        print(f"Gray text min-max values: {gray_text.min()}-{gray_text.max()}")
-
-        # 使用pytesseract获取文字信息，包括边界框
-        text_data = pytesseract.image_to_data(gray_text, output_type=pytesseract.Output.DICT)
-        
-        print(f"Number of detected words: {len(text_data['text'])}")
-        print(f"Sample words: {text_data['text'][:5]}")  # 打印前5个检测到的单词
-
-        # 估计原始字体大小
-        estimated_font_size = self.estimate_font_size(text_data)
-        print(f"Estimated font size: {estimated_font_size}")
-
-        # 创建一个新的高分辨率图像用于渲染文字
-        scale_factor = target_dpi / original_dpi
-        new_height, new_width = int(image.shape[0] * scale_factor), int(image.shape[1] * scale_factor)
-        enhanced_text = np.zeros((new_height, new_width, 3), dtype=np.uint8)  # 创建黑色背景
-
-        # 使用高分辨率字体重新渲染文字
-        pil_image = Image.fromarray(enhanced_text)
-        draw = ImageDraw.Draw(pil_image)
-        
-        words_rendered = 0
-        for i, word in enumerate(text_data['text']):
-            if int(text_data['conf'][i]) > 60 and word.strip():  # 只渲染置信度高于60%的非空文字
-                font_size = max(int(estimated_font_size * scale_factor), 12)  # 确保字体大小至少为12
-                font = self.get_default_font(font_size)
-                x = int(text_data['left'][i] * scale_factor)
-                y = int(text_data['top'][i] * scale_factor)
-                draw.text((x, y), word, font=font, fill=(255, 255, 255))  # 白色文字
-                words_rendered += 1
-
-        print(f"Number of words rendered: {words_rendered}")
-
-        enhanced_text = np.array(pil_image)
-
-        print(f"Enhanced text array shape: {enhanced_text.shape}")
-        print(f"Enhanced text array dtype: {enhanced_text.dtype}")
-        print(f"Enhanced text array min-max values: {enhanced_text.min()}-{enhanced_text.max()}")
-
-        # 如果enhanced_text全黑，尝试直接使用放大的原始文本区域
-        if enhanced_text.max() == 0:
-            print("Warning: Enhanced text is all black. Using scaled original text area.")
-            enhanced_text = cv2.resize(text_area, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+    def merge_bands(self, enhanced_text, enhanced_image_area, bilevel=False):
+        # 合并（饱和相加）、阈值化和全白检查在每个行带上一次完成，行带之间并行；
+        # 结果写回 enhanced_image_area，不再分配整页大小的中间数组。
+        # bilevel 为 True 时每个行带阈值化后直接打包成 1 位，返回 BilevelImage
+        output = enhanced_image_area
+        height, width = output.shape[:2]
+        packed = BilevelImage(width, height) if bilevel else None
+        text_height, text_width = enhanced_text.shape[:2]
+        resample = (text_height, text_width) != (height, width)
+
+        def process(band):
+            y0, y1 = band
+            if resample:
+                # 文字层尺寸不一致时只对本行带插值，多取几行作为插值核的上下文
+                sy0 = max(y0 * text_height // height - 2, 0)
+                sy1 = min(-(-y1 * text_height // height) + 2, text_height)
+                text_band = resize_rows(enhanced_text[sy0:sy1], sy0, (text_width, text_height), (width, height), y0, y1)
+            else:
+                text_band = enhanced_text[y0:y1]
+            target = output[y0:y1]
+            cv2.add(text_band, target, dst=target)
+            cv2.threshold(target, 128, 255, cv2.THRESH_BINARY, dst=target)
+            if packed is not None:
+                packed.data[y0:y1] = pack_rows(target)
+            return target.min() == 255
+
+        bands = [(y0, min(y0 + self.band_height, height)) for y0 in range(0, height, self.band_height)]
+        workers = min(self.execution.num_threads or os.cpu_count() or 1, len(bands))
+        if workers <= 1:
+            white = [process(band) for band in bands]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                white = list(pool.map(process, bands))
+
+        return packed if bilevel else output, all(white)
+
+    def enhance_text_with_ocr(self, image, text_mask, original_dpi, target_dpi, page_key=None, cancel_check=None):
+        profiler = self.profiler
+
+        with profiler.span("ocr"):
+            cached = self.intermediates.get(('ocr', page_key)) if page_key is not None else None
+            if cached is not None:
+                text_data, estimated_font_size = cached
+                profiler.annotate(reused=True)
+            else:
+                # 对文字区域应用OCR
+                text_area = cv2.bitwise_and(image, image, mask=text_mask)
+                gray_text = cv2.cvtColor(text_area, cv2.COLOR_BGR2GRAY)
+
+                # 使用pytesseract获取文字信息，包括边界框；文本块并行识别后合并回页面坐标
+                text_data = self.ocr.image_to_data(gray_text, text_mask, cancel_check)
+
+                # 估计原始字体大小
+                estimated_font_size = self.estimate_font_size(text_data)
+                if page_key is not None:
+                    self.intermediates.put(('ocr', page_key), (text_data, estimated_font_size))
+            profiler.annotate(words_detected=len(text_data['text']), estimated_font_size=estimated_font_size)
+
+        with profiler.span("render"):
+            # 创建一个新的高分辨率图像用于渲染文字
+            scale_factor = target_dpi / original_dpi
+            new_height, new_width = int(image.shape[0] * scale_factor), int(image.shape[1] * scale_factor)
+            enhanced_text = np.zeros((new_height, new_width, 3), dtype=np.uint8)  # 创建黑色背景
+
+            # 使用高分辨率字体重新渲染文字
+            pil_image = Image.fromarray(enhanced_text)
+            draw = ImageDraw.Draw(pil_image)
+
+            words = []
+            for i, word in enumerate(text_data['text']):
+                if int(text_data['conf'][i]) > 60 and word.strip():  # 只渲染置信度高于60%的非空文字
+                    font_size = max(int(estimated_font_size * scale_factor), 12)  # 确保字体大小至少为12
+                    x = int(text_data['left'][i] * scale_factor)
+                    y = int(text_data['top'][i] * scale_factor)
+                    words.append((x, y, word, font_size))
+            words_rendered = self.fonts.render_words(draw, words, fill=(255, 255, 255))  # 白色文字
+            profiler.annotate(words_rendered=words_rendered)
+
+            enhanced_text = np.array(pil_image)
+
+            # 如果enhanced_text全黑，尝试直接使用放大的原始文本区域
+            if enhanced_text.max() == 0:
+                print("Warning: Enhanced text is all black. Using scaled original text area.")
+                text_area = cv2.bitwise_and(image, image, mask=text_mask)
+                enhanced_text = cv2.resize(text_area, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
 
         return enhanced_text
 
     def get_default_font(self, font_size):
-        try:
-            # 尝试使用 TrueType 字体
-            font = ImageFont.truetype(font="arial.ttf", size=font_size)
-        except IOError:
-            try:
-                # 如果 arial.ttf 不
-                font = ImageFont.truetype(font="arial.ttf", size=font_size)
-            except IOError:
-                # 如果仍然失败，使用默认位图字体
-                font = ImageFont.load_default()
-                print("Warning: Using default bitmap font. Text quality may be poor.")
-        return font
+        # 字体文件只查找一次，字体对象按字号缓存
+        return self.fonts.get_font(font_size)
 
     def estimate_font_size(self, text_data):
         heights = [text_data['height'][i] for i in range(len(text_data['text'])) 
@@ -144,30 +286,185 @@ class DPIEnhancer:
         else:
             return 12  # 如果无法估计，则返回默认值
 
-    def enhance_image_area(self, image, image_mask, original_dpi, target_dpi):
-        # 对图像区域应用EDSR模型
+    def enhance_image_area(self, image, image_mask, original_dpi, target_dpi, interpolation_method=None, sr_tier=None,
+                           page_key=None, cancel_check=None):
+        height, width = image.shape[:2]
+        plan = self.planner.plan(width, height, target_dpi / original_dpi, tier=sr_tier)
+        self.last_plan = plan
+        flag = interpolation_flag(interpolation_method)
+
+        # 比例很小时超分辨率模型没有收益，直接插值到目标尺寸
+        if not plan.uses_model:
+            with self.profiler.span("resize", stage="image-area", plan=repr(plan)):
+                return cv2.resize(cv2.bitwise_and(image, image, mask=image_mask), plan.output_size, interpolation=flag)
+
+        # 模型原始倍率的输出放得进中间结果缓存时，先缓存再插值到目标尺寸，之后换目标 DPI 只需重新插值
+        native_bytes = image.nbytes * plan.model_scale ** 2
+        if page_key is not None and native_bytes <= self.intermediate_bytes:
+            key = ('native', page_key, plan.model, self.tile_size, self.tile_halo, self.region_padding,
+                   self.max_region_coverage)
+            regions = self.intermediates.get(key)
+            reused = regions is not None
+            if not reused:
+                with self.profiler.span("edsr", plan=repr(plan), model=plan.model[0], native=True):
+                    regions = self.native_regions(image, image_mask, plan.model, cancel_check)
+                self.intermediates.put(key, regions)
+            with self.profiler.span("resize", stage="image-area", plan=repr(plan), reused=reused):
+                return self.place_regions(regions, image.shape, plan, flag)
+
         image_area = cv2.bitwise_and(image, image, mask=image_mask)
-        enhanced_image = self.sr.upsample(image_area)
-        
-        print(f"Enhanced image area shape: {enhanced_image.shape}")
-        print(f"Enhanced image area dtype: {enhanced_image.dtype}")
-        print(f"Enhanced image area min-max values: {enhanced_image.min()}-{enhanced_image.max()}")
 
-        # 如果需要，进一步调整大小以匹配目标DPI
-        scale_factor = target_dpi / original_dpi
-        if scale_factor != 4:  # EDSR模型是4倍放大
-            height, width = enhanced_image.shape[:2]
-            new_height = int(height * (scale_factor / 4))
-            new_width = int(width * (scale_factor / 4))
-            enhanced_image = cv2.resize(enhanced_image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-        
+        with self.profiler.span("edsr", plan=repr(plan), model=plan.model[0]):
+            # 对图像区域应用超分辨率模型，模型输出与目标尺寸不同时只插值一次
+            enhanced_image = self.upscale_regions(image_area, image_mask, plan, flag, cancel_check)
+
+            if self.profiler.enabled:
+                self.profiler.annotate(**array_stats(enhanced_image))
+
+        return enhanced_image
+
+    def get_upscaler(self, name, scale):
+        # 默认的 EDSR x4 沿用 self.upscaler，其他模型按需创建
+        if (name, scale) == ("edsr", 4):
+            return self.upscaler
+        upscaler = self._upscalers.get((name, scale))
+        if upscaler is None:
+            upscaler = TiledUpscaler(self.registry.get(name, scale), scale=scale,
+                                     tile_size=self.tile_size, halo=self.tile_halo)
+            self._upscalers[(name, scale)] = upscaler
+        return upscaler
+
+    def region_boxes(self, image_mask):
+        # 需要超分辨率的区域；覆盖率过高时返回 None，表示整页处理
+        height, width = image_mask.shape[:2]
+        boxes = mask_bounding_boxes(image_mask, padding=self.region_padding)
+        covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes)
+        if covered > self.max_region_coverage * height * width:
+            return None
+        return boxes
+
+    def upscale_regions(self, image_area, image_mask, plan, interpolation=cv2.INTER_LANCZOS4, cancel_check=None):
+        upscaler = self.get_upscaler(*plan.model)
+        out_width, out_height = plan.output_size
+        boxes = self.region_boxes(image_mask)
+        if boxes is None:
+            return self.upscale_bands(image_area, upscaler, plan, interpolation, cancel_check)
+
+        # 掩码以外的区域在 image_area 中已经是黑色，直接用常量填充；
+        # 每个区域按行带放大并直接插值到目标尺寸中的位置，模型倍率的中间结果只有一个行带大小
+        enhanced_image = np.zeros((out_height, out_width) + image_area.shape[2:], dtype=image_area.dtype)
+        for x0, y0, x1, y1 in boxes:
+            if cancel_check is not None:
+                cancel_check()
+            region = image_area[y0:y1, x0:x1]
+            if plan.needs_resample:
+                target = self.region_target(enhanced_image, (x0, y0, x1, y1), plan.scale_factor)
+                if target is not None:
+                    tx0, ty0, tx1, ty1 = target
+                    self.resample_bands(region, upscaler, enhanced_image[ty0:ty1, tx0:tx1], interpolation,
+                                        cancel_check)
+            else:
+                self.place_region(enhanced_image, (x0, y0, x1, y1), plan.scale_factor, interpolation,
+                                  lambda: upscaler.upscale(np.ascontiguousarray(region), cancel_check))
+
         return enhanced_image
 
+    @staticmethod
+    def region_target(enhanced_image, box, scale):
+        # 区域在目标图像中的位置，裁剪到图像范围内；为空时返回 None
+        out_height, out_width = enhanced_image.shape[:2]
+        x0, y0, x1, y1 = box
+        tx0, ty0 = int(x0 * scale), int(y0 * scale)
+        tx1, ty1 = min(int(x1 * scale), out_width), min(int(y1 * scale), out_height)
+        if tx1 <= tx0 or ty1 <= ty0:
+            return None
+        return tx0, ty0, tx1, ty1
+
+    def place_region(self, enhanced_image, box, scale, interpolation, upscale):
+        # 把一个区域的模型输出缩放到目标图像中的对应位置；upscale() 返回模型原始倍率的区域
+        target = self.region_target(enhanced_image, box, scale)
+        if target is None:
+            return
+        tx0, ty0, tx1, ty1 = target
+        crop = upscale()
+        if crop.shape[1] != tx1 - tx0 or crop.shape[0] != ty1 - ty0:
+            crop = cv2.resize(crop, (tx1 - tx0, ty1 - ty0), interpolation=interpolation)
+        enhanced_image[ty0:ty1, tx0:tx1] = crop
+
+    def native_regions(self, image, image_mask, model, cancel_check=None):
+        # 模型原始倍率的输出，与目标 DPI 无关：[(x0, y0, x1, y1, 放大后的区域)]，整页处理时只有一项
+        upscaler = self.get_upscaler(*model)
+        height, width = image.shape[:2]
+        image_area = cv2.bitwise_and(image, image, mask=image_mask)
+        boxes = self.region_boxes(image_mask)
+        if boxes is None:
+            return [(0, 0, width, height, upscaler.upscale(image_area, cancel_check))]
+        return [(x0, y0, x1, y1, upscaler.upscale(np.ascontiguousarray(image_area[y0:y1, x0:x1]), cancel_check))
+                for x0, y0, x1, y1 in boxes]
+
+    def place_regions(self, regions, image_shape, plan, interpolation=cv2.INTER_LANCZOS4):
+        # 由缓存的模型输出生成目标尺寸的图像区域；结果是新数组，合并阶段原地修改不会影响缓存
+        height, width = image_shape[:2]
+        if len(regions) == 1 and regions[0][:4] == (0, 0, width, height):
+            native = regions[0][4]
+            if native.shape[1::-1] == plan.output_size:
+                return native.copy()
+            return cv2.resize(native, plan.output_size, interpolation=interpolation)
+
+        out_width, out_height = plan.output_size
+        enhanced_image = np.zeros((out_height, out_width) + image_shape[2:], dtype=np.uint8)
+        for x0, y0, x1, y1, native in regions:
+            self.place_region(enhanced_image, (x0, y0, x1, y1), plan.scale_factor, interpolation, lambda: native)
+        return enhanced_image
+
+    def upscale_bands(self, image_area, upscaler, plan, interpolation=cv2.INTER_LANCZOS4, cancel_check=None):
+        if not plan.needs_resample:
+            return upscaler.upscale(image_area, cancel_check)
+
+        out_width, out_height = plan.output_size
+        output = np.empty((out_height, out_width) + image_area.shape[2:], dtype=image_area.dtype)
+        self.resample_bands(image_area, upscaler, output, interpolation, cancel_check)
+        return output
+
+    def resample_bands(self, image_area, upscaler, output, interpolation=cv2.INTER_LANCZOS4, cancel_check=None):
+        # 按行带放大后直接插值到 output 的尺寸，模型倍率的中间结果只有一个行带大小；output 可以是目标图像的切片
+        height, width = image_area.shape[:2]
+        model_scale = upscaler.scale
+        out_height, out_width = output.shape[:2]
+        band_height = self.tile_size * 2
+        # 行带上下多取的行：超分辨率的上下文加上插值核的半径
+        context = self.tile_halo + 4
+        # 行带边界对齐到输入/输出行数之比的周期上时，resize_rows 可以直接用 cv2.resize
+        period = height // math.gcd(height, out_height)
+        if period > context:
+            period = 1
+
+        for y0 in range(0, height, band_height):
+            if cancel_check is not None:
+                cancel_check()
+            y1 = min(y0 + band_height, height)
+            ey0 = max(y0 - context, 0) // period * period
+            ey1 = min(-(-(y1 + context) // period) * period, height)
+            band = upscaler.upscale(np.ascontiguousarray(image_area[ey0:ey1]), cancel_check)
+            ty0, ty1 = y0 * out_height // height, y1 * out_height // height
+            if ty1 > ty0:
+                output[ty0:ty1] = resize_rows(band, ey0 * model_scale, (width * model_scale, height * model_scale),
+                                              (out_width, out_height), ty0, ty1, interpolation)
+
     def sharpen_text(self, image):
         # 使用锐化滤镜增强文字清晰度
         kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
         return cv2.filter2D(image, -1, kernel)
 
-    def save_image(self, image, output_path, dpi):
+    def save_image(self, image, output_path, dpi, compression=None):
+        # 指定 compression（group4/lzw/deflate/none）时按 1 位分块 TIFF 逐行带写出，不再转换整页颜色；
+        # BilevelImage 没有指定压缩方式时默认 CCITT Group 4
+        if isinstance(image, BilevelImage) and compression is None:
+            compression = 'group4'
+        if compression is not None:
+            height, width = image.shape[:2]
+            with BilevelTIFWriter(output_path, width, height, dpi, compression=compression) as writer:
+                writer.write_image(image, self.band_height)
+            return
         pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         pil_image.save(output_path, dpi=(dpi, dpi))
@@ -0,0 +1,97 @@
+import os
+
+import cv2
+
+# 名称到 cv2.dnn 常量名；旧版本 OpenCV 缺少的常量在使用时跳过
+DNN_BACKENDS = {
+    'default': 'DNN_BACKEND_DEFAULT',
+    'opencv': 'DNN_BACKEND_OPENCV',
+    'openvino': 'DNN_BACKEND_INFERENCE_ENGINE',
+    'cuda': 'DNN_BACKEND_CUDA',
+}
+DNN_TARGETS = {
+    'cpu': 'DNN_TARGET_CPU',
+    'cpu_fp16': 'DNN_TARGET_CPU_FP16',
+    'opencl': 'DNN_TARGET_OPENCL',
+    'opencl_fp16': 'DNN_TARGET_OPENCL_FP16',
+    'cuda': 'DNN_TARGET_CUDA',
+    'cuda_fp16': 'DNN_TARGET_CUDA_FP16',
+}
+
+
+def available_dnn_targets(backend):
+    # 返回该后端可用的目标名称；后端不存在或不可用时为空
+    backend_id = getattr(cv2.dnn, DNN_BACKENDS.get(backend, ''), None)
+    if backend_id is None:
+        return []
+    if backend == 'default':
+        return ['cpu']
+    try:
+        target_ids = set(cv2.dnn.getAvailableTargets(backend_id))
+    except (AttributeError, cv2.error):
+        return []
+    return [name for name, attr in DNN_TARGETS.items() if getattr(cv2.dnn, attr, None) in target_ids]
+
+
+class ExecutionSettings:
+    # 每个进程的线程数和 DNN 后端/目标设置。cv2.setNumThreads 对整个进程生效，
+    # 多进程批处理时每个进程分到 CPU 核数 / 进程数 个线程，避免超额订阅
+    def __init__(self, num_threads=None, dnn_backend='default', dnn_target='cpu'):
+        if dnn_backend not in DNN_BACKENDS:
+            raise ValueError(f"Unknown DNN backend: {dnn_backend}")
+        if dnn_target not in DNN_TARGETS:
+            raise ValueError(f"Unknown DNN target: {dnn_target}")
+        self.num_threads = num_threads
+        self.dnn_backend = dnn_backend
+        self.dnn_target = dnn_target
+        # 实际生效的后端/目标，请求的组合不可用时回退到 default/cpu
+        self.resolved_backend = None
+        self.resolved_target = None
+
+    @classmethod
+    def from_env(cls, default_threads=None):
+        # 图形界面等没有命令行参数的入口通过环境变量调整
+        threads = os.environ.get('TIF_DPI_THREADS')
+        return cls(num_threads=int(threads) if threads else default_threads,
+                   dnn_backend=os.environ.get('TIF_DPI_DNN_BACKEND', 'default'),
+                   dnn_target=os.environ.get('TIF_DPI_DNN_TARGET', 'cpu'))
+
+    @classmethod
+    def for_workers(cls, workers, threads_per_worker=None, **kwargs):
+        if threads_per_worker is None:
+            threads_per_worker = max((os.cpu_count() or 1) // max(workers, 1), 1)
+        return cls(num_threads=threads_per_worker, **kwargs)
+
+    def resolve(self):
+        if self.resolved_backend is None:
+            if self.dnn_target in available_dnn_targets(self.dnn_backend):
+                self.resolved_backend, self.resolved_target = self.dnn_backend, self.dnn_target
+            else:
+                print(f"Warning: DNN backend '{self.dnn_backend}' with target '{self.dnn_target}' "
+                      f"is not available, using default/cpu.")
+                self.resolved_backend, self.resolved_target = 'default', 'cpu'
+        return self.resolved_backend, self.resolved_target
+
+    def apply(self):
+        # 在每个进程中调用一次（例如进程池的 initializer 中）
+        if self.num_threads is not None:
+            cv2.setNumThreads(self.num_threads)
+        self.resolve()
+        return self
+
+    def configure_model(self, sr):
+        # sr 是 DnnSuperResImpl，在 readModel 之后、第一次推理之前调用
+        backend, target = self.resolve()
+        sr.setPreferableBackend(getattr(cv2.dnn, DNN_BACKENDS[backend]))
+        sr.setPreferableTarget(getattr(cv2.dnn, DNN_TARGETS[target]))
+
+    def to_dict(self):
+        return {
+            'num_threads': self.num_threads,
+            'opencv_threads': cv2.getNumThreads(),
+            'cpu_count': os.cpu_count(),
+            'dnn_backend': self.dnn_backend,
+            'dnn_target': self.dnn_target,
+            'resolved_backend': self.resolved_backend,
+            'resolved_target': self.resolved_target,
+        }
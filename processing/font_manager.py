@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+# 按顺序尝试的字体；ImageFont.truetype 会在系统字体目录中查找文件名
+DEFAULT_FONT_CANDIDATES = (
+    "arial.ttf",
+    "Arial.ttf",
+    "DejaVuSans.ttf",
+    "LiberationSans-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+)
+
+
+class FontManager:
+    def __init__(self, font_path=None, max_cached=32):
+        # font_path 为空时依次尝试环境变量 TIF_DPI_FONT 和默认字体列表
+        self.font_path = font_path or os.environ.get("TIF_DPI_FONT")
+        self.max_cached = max_cached
+        self._resolved_path = None
+        self._resolved = False
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve_font_path(self):
+        # 只在第一次使用时查找一次字体文件
+        if not self._resolved:
+            candidates = (self.font_path,) if self.font_path else DEFAULT_FONT_CANDIDATES
+            for candidate in candidates:
+                try:
+                    ImageFont.truetype(font=candidate, size=12)
+                except (IOError, OSError):
+                    continue
+                self._resolved_path = candidate
+                break
+            else:
+                print("Warning: Using default bitmap font. Text quality may be poor.")
+            self._resolved = True
+        return self._resolved_path
+
+    def get_font(self, font_size):
+        with self._lock:
+            font = self._fonts.get(font_size)
+            if font is not None:
+                self._fonts.move_to_end(font_size)
+                return font
+
+        font = self._load_font(font_size)
+        with self._lock:
+            self._fonts[font_size] = font
+            while len(self._fonts) > self.max_cached:
+                self._fonts.popitem(last=False)
+        return font
+
+    def _load_font(self, font_size):
+        path = self.resolve_font_path()
+        if path is not None:
+            return ImageFont.truetype(font=path, size=font_size)
+        try:
+            # Pillow >= 10.1 自带可缩放的默认字体
+            return ImageFont.load_default(size=font_size)
+        except TypeError:
+            return ImageFont.load_default()
+
+    def render_words(self, draw, words, fill):
+        # words: [(x, y, text, font_size)]，按字号分组后批量绘制，每个字号只取一次字体对象
+        by_size = {}
+        for x, y, text, font_size in words:
+            by_size.setdefault(font_size, []).append((x, y, text))
+
+        for font_size, group in by_size.items():
+            font = self.get_font(font_size)
+            for x, y, text in group:
+                draw.text((x, y), text, font=font, fill=fill)
+
+        return len(words)
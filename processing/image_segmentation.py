@@ -6,14 +6,56 @@ LastEditTime: 2024-10-16 22:58:22
 FilePath: /TIFF DPI Enhancer/processing/image_segmentation.py
 Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查看配置 进行设置: https://github.com/OBKoro1/koro1FileHeader/wiki/%E9%85%8D%E7%BD%AE%E5%8E%9F%E5%85%B3
 '''
+import time
+
 import cv2
 import numpy as np
 
+from utils.cache_utils import TieredCache, content_hash
+
+# 进程内共享的掩码缓存，GUI、增强器和批处理对同一张图像只分割一次
+_shared_cache = TieredCache(max_entries=8, max_bytes=1024 * 1024 * 1024)
+
+
 class ImageSegmenter:
-    def __init__(self):
-        pass
+    def __init__(self, cache=None):
+        # 参与缓存键计算的分割参数
+        self.text_scales = (0.5, 1.0, 1.5)
+        self.text_min_size = 10
+        self.text_refine_min_size = 50
+        self.image_refine_min_size = 100
+        self.saturation_threshold = 100
+        self.cache = cache if cache is not None else _shared_cache
+
+    def cache_params(self):
+        return {
+            'text_scales': self.text_scales,
+            'text_min_size': self.text_min_size,
+            'text_refine_min_size': self.text_refine_min_size,
+            'image_refine_min_size': self.image_refine_min_size,
+            'saturation_threshold': self.saturation_threshold,
+        }
+
+    def _cached(self, stage, image, compute):
+        key = content_hash(image, stage=stage, **self.cache_params())
+        masks = self.cache.get(key)
+        if masks is None:
+            masks = compute()
+            self.cache.put(key, tuple(mask.copy() for mask in masks))
+            return masks
+        # 调用方会原地修改掩码，返回副本
+        return tuple(mask.copy() for mask in masks)
 
     def segment_image(self, image):
+        return self._cached('segment', image, lambda: self._segment_image(image))
+
+    def segment_and_refine(self, image):
+        def compute():
+            text_mask, image_mask = self.segment_image(image)
+            return self.refine_masks(text_mask, image_mask, image)
+        return self._cached('segment+refine', image, compute)
+
+    def _segment_image(self, image):
         # 转换为灰度图像
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
@@ -29,41 +71,105 @@ class ImageSegmenter:
         return text_mask, image_mask
 
     def detect_text(self, gray_image):
-        # 多尺度文本检测
-        scales = [0.5, 1.0, 1.5]
-        text_masks = []
+        # 多尺度文本检测：按金字塔逐层处理，结果原地累加到同一个输出缓冲区
+        height, width = gray_image.shape[:2]
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        final_mask = None
+        upsampled = None
+
+        for scale, level in self._text_pyramid(gray_image):
+            mask = self._detect_text_level(level, kernel)
+
+            if mask.shape[:2] != (height, width):
+                # 复用同一个临时缓冲区将结果调整回原始大小
+                if upsampled is None:
+                    upsampled = np.empty_like(gray_image)
+                cv2.resize(mask, (width, height), dst=upsampled, interpolation=cv2.INTER_LINEAR)
+                mask = upsampled
+
+            # 合并所有尺度的结果
+            if final_mask is None:
+                final_mask = mask.copy() if mask is upsampled else mask
+            else:
+                np.maximum(final_mask, mask, out=final_mask)
 
+        # 再次应用形态学操作以连接相近区域
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+        cv2.morphologyEx(final_mask, cv2.MORPH_CLOSE, kernel, dst=final_mask)
+        
+        return final_mask
+
+    def _text_pyramid(self, gray_image):
+        # 原始尺度直接使用灰度图；放大的层由原图得到，缩小的层由上一层（更大的一层）缩放得到
+        scales = sorted(self.text_scales)
+        if 1.0 in scales:
+            yield 1.0, gray_image
         for scale in scales:
-            # 调整图像大小
+            if scale > 1.0:
+                yield scale, cv2.resize(gray_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        previous_scale, previous = 1.0, gray_image
+        for scale in reversed(scales):
+            if scale < 1.0:
+                ratio = scale / previous_scale
+                previous = cv2.resize(previous, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_LINEAR)
+                previous_scale = scale
+                yield scale, previous
+
+    def _detect_text_level(self, level, kernel):
+        # 使用自适应阈值处理
+        binary = cv2.adaptiveThreshold(level, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+
+        # 边缘检测，并原地与二值图像组合
+        edges = cv2.Canny(level, 100, 200)
+        cv2.bitwise_or(binary, edges, dst=binary)
+        del edges
+
+        # 使用形态学操作来连接相近的文本区域
+        cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel, dst=binary)
+
+        # 移除小的噪点
+        return self.remove_small_regions(binary, min_size=self.text_min_size)
+
+    def compare_text_detection(self, gray_image):
+        # 验证模式：与逐尺度实现比较，返回掩码 IoU 和两者的耗时
+        start = time.perf_counter()
+        reference = self._detect_text_reference(gray_image)
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mask = self.detect_text(gray_image)
+        seconds = time.perf_counter() - start
+
+        reference_fg = reference > 0
+        fg = mask > 0
+        union = np.count_nonzero(reference_fg | fg)
+        intersection = np.count_nonzero(reference_fg & fg)
+        return {
+            'iou': intersection / union if union else 1.0,
+            'identical': bool(np.array_equal(reference, mask)),
+            'seconds': seconds,
+            'reference_seconds': reference_seconds,
+        }
+
+    def _detect_text_reference(self, gray_image):
+        # 原来的逐尺度实现：每个尺度生成一张全尺寸掩码后再合并
+        text_masks = []
+
+        for scale in self.text_scales:
             resized = cv2.resize(gray_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
-            
-            # 使用自适应阈值处理
             binary = cv2.adaptiveThreshold(resized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
-            
-            # 边缘检测
             edges = cv2.Canny(resized, 100, 200)
-            
-            # 组合二值图像和边缘
             combined = cv2.bitwise_or(binary, edges)
-            
-            # 使用形态学操作来连接相近的文本区域
             kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
             connected = cv2.morphologyEx(combined, cv2.MORPH_CLOSE, kernel)
-            
-            # 移除小的噪点
-            denoised = self.remove_small_regions(connected, min_size=10)
-            
-            # 将结果调整回原始大小
+            denoised = self.remove_small_regions(connected, min_size=self.text_min_size)
             mask = cv2.resize(denoised, (gray_image.shape[1], gray_image.shape[0]), interpolation=cv2.INTER_LINEAR)
             text_masks.append(mask)
 
-        # 合并所有尺度的结果
         final_mask = np.max(text_masks, axis=0)
-        
-        # 再次应用形态学操作以连接相近区域
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
         final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_CLOSE, kernel)
-        
+
         return final_mask
 
     def detect_image_areas(self, image, gray_image):
@@ -93,19 +199,20 @@ class ImageSegmenter:
         # 使用颜色信息进一步细化图像区域
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         saturation = hsv[:,:,1]
-        high_saturation = saturation > 100
+        high_saturation = saturation > self.saturation_threshold
         image_mask[high_saturation] = 255
         
         return image_mask
 
     def remove_small_regions(self, mask, min_size=100):
         # 标记连通区域
-        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
         
-        # 移除小区域
-        for i in range(1, num_labels):
-            if stats[i, cv2.CC_STAT_AREA] < min_size:
-                mask[labels == i] = 0
+        # 移除小区域：按面积建立查找表，一次索引完成所有标签
+        remove = stats[:, cv2.CC_STAT_AREA] < min_size
+        remove[0] = False  # 背景
+        if remove.any():
+            mask[remove[labels]] = 0
         
         return mask
 
@@ -115,12 +222,12 @@ class ImageSegmenter:
         saturation = hsv[:,:,1]
         
         # 假设高饱和度区域更可能是图像
-        high_saturation = saturation > 100
+        high_saturation = saturation > self.saturation_threshold
         image_mask[high_saturation] = 255
         text_mask[high_saturation] = 0
         
         # 移除小的孤立区域
-        text_mask = self.remove_small_regions(text_mask, min_size=50)
-        image_mask = self.remove_small_regions(image_mask, min_size=100)
+        text_mask = self.remove_small_regions(text_mask, min_size=self.text_refine_min_size)
+        image_mask = self.remove_small_regions(image_mask, min_size=self.image_refine_min_size)
         
         return text_mask, image_mask
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+
+import cv2
+
+from utils.memory_utils import current_rss
+
+MODEL_DIR = "models"
+
+# cv2.dnn_superres 的算法名与模型文件名前缀
+MODEL_FILE_PREFIXES = {
+    'edsr': 'EDSR',
+    'espcn': 'ESPCN',
+    'fsrcnn': 'FSRCNN',
+    'lapsrn': 'LapSRN',
+}
+
+# 各后端在 CPU 上的粗略耗时（秒/百万输入像素），用于自动选择；实际运行后改用测得的速度
+DEFAULT_SECONDS_PER_MEGAPIXEL = {
+    'edsr': 60.0,
+    'lapsrn': 6.0,
+    'fsrcnn': 0.4,
+    'espcn': 0.25,
+    'interpolation': 0.02,
+}
+# 测得的速度至少基于这么多像素才可信
+MIN_MEASURED_PIXELS = 256 * 256
+
+
+class SuperResModel:
+    # 进程内共享的超分辨率模型句柄，第一次使用时才加载。
+    # 其他后端继承该类并重写 _create，返回任何带 upsample(image) 方法的对象
+    needs_model_file = True
+
+    def __init__(self, name, scale, path):
+        self.name = name
+        self.scale = scale
+        self.path = path
+        self.load_seconds = None
+        self.memory_bytes = None
+        self.pixels = 0
+        self.busy_seconds = 0.0
+        # ExecutionSettings，决定 DNN 后端/目标
+        self.settings = None
+        self._sr = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._sr is not None
+
+    def load(self):
+        with self._lock:
+            if self._sr is None:
+                rss_before = current_rss()
+                start = time.perf_counter()
+                sr = self._create()
+                self.load_seconds = time.perf_counter() - start
+                rss_after = current_rss()
+                if rss_before is not None and rss_after is not None:
+                    self.memory_bytes = max(rss_after - rss_before, 0)
+                self._sr = sr
+        return self
+
+    def _create(self):
+        sr = cv2.dnn_superres.DnnSuperResImpl_create()
+        sr.readModel(self.path)
+        sr.setModel(self.name, self.scale)
+        if self.settings is not None:
+            self.settings.configure_model(sr)
+        return sr
+
+    def unload(self):
+        # 执行设置改变后释放模型，下次使用时按新设置重新加载
+        with self._lock:
+            self._sr = None
+
+    def upsample(self, image):
+        self.load()
+        # DnnSuperResImpl 不是线程安全的，同一模型的推理串行执行
+        with self._lock:
+            start = time.perf_counter()
+            result = self._sr.upsample(image)
+            self.busy_seconds += time.perf_counter() - start
+            self.pixels += image.shape[0] * image.shape[1]
+            return result
+
+    def seconds_per_megapixel(self):
+        if self.pixels >= MIN_MEASURED_PIXELS:
+            return self.busy_seconds / (self.pixels / 1e6)
+        return DEFAULT_SECONDS_PER_MEGAPIXEL.get(self.name, DEFAULT_SECONDS_PER_MEGAPIXEL['edsr'])
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'scale': self.scale,
+            'path': self.path,
+            'loaded': self.loaded,
+            'load_seconds': self.load_seconds,
+            'memory_bytes': self.memory_bytes,
+            'file_bytes': os.path.getsize(self.path) if self.path and os.path.exists(self.path) else None,
+            'seconds_per_megapixel': self.seconds_per_megapixel(),
+        }
+
+
+class _Resizer:
+    def __init__(self, scale, interpolation):
+        self.scale = scale
+        self.interpolation = interpolation
+
+    def upsample(self, image):
+        return cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=self.interpolation)
+
+
+class InterpolationModel(SuperResModel):
+    # 不需要模型文件的插值后端，接口与超分辨率模型相同
+    needs_model_file = False
+
+    def __init__(self, name, scale, path=None, interpolation=cv2.INTER_CUBIC):
+        super().__init__(name, scale, None)
+        self.interpolation = interpolation
+
+    def _create(self):
+        return _Resizer(self.scale, self.interpolation)
+
+
+# 模型名到后端类的映射，未列出的名称按 cv2.dnn_superres 模型处理
+BACKENDS = {
+    'interpolation': InterpolationModel,
+}
+
+
+class ModelRegistry:
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self.backends = dict(BACKENDS)
+        self.settings = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model_path(self, name, scale):
+        prefix = MODEL_FILE_PREFIXES.get(name, name.upper())
+        return os.path.join(self.model_dir, f"{prefix}_x{scale}.pb")
+
+    def register_backend(self, name, backend_class):
+        # backend_class(name, scale, path) 需要提供 load/upsample/stats/seconds_per_megapixel
+        self.backends[name] = backend_class
+
+    def configure(self, settings):
+        with self._lock:
+            self.settings = settings
+            models = list(self._models.values())
+        for model in models:
+            if model.settings is not settings:
+                model.settings = settings
+                if model.loaded:
+                    model.unload()
+
+    def backend_class(self, name):
+        return self.backends.get(name, SuperResModel)
+
+    def is_available(self, name, scale):
+        if not self.backend_class(name).needs_model_file:
+            return True
+        return os.path.exists(self.model_path(name, scale))
+
+    def get(self, name='edsr', scale=4):
+        key = (name, scale)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self.backend_class(name)(name, scale, self.model_path(name, scale))
+                model.settings = self.settings
+                self._models[key] = model
+        return model
+
+    def preload(self, name='edsr', scale=4):
+        return self.get(name, scale).load()
+
+    def stats(self):
+        with self._lock:
+            models = list(self._models.values())
+        return [model.stats() for model in models]
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        return _default_registry
@@ -0,0 +1,130 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytesseract
+
+from utils.cache_utils import TieredCache, content_hash
+from utils.image_utils import mask_bounding_boxes
+
+# 进程内共享的 OCR 结果缓存；识别结果只取决于源像素和 tesseract 配置
+_shared_cache = TieredCache(max_entries=64)
+_tesseract_version = None
+
+
+def tesseract_version():
+    global _tesseract_version
+    if _tesseract_version is None:
+        try:
+            _tesseract_version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            _tesseract_version = 'unknown'
+    return _tesseract_version
+
+
+class OCRRunner:
+    def __init__(self, max_workers=None, block_padding=10, min_block_area=50, lang=None, config='', cache=None):
+        # pytesseract 为每次调用启动一个 tesseract 进程，用线程池即可并行
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.block_padding = block_padding
+        self.min_block_area = min_block_area
+        self.lang = lang
+        self.config = config
+        self.cache = cache if cache is not None else _shared_cache
+
+    def cache_params(self):
+        # 分组方式会影响识别结果，一并计入缓存键
+        return {
+            'lang': self.lang,
+            'config': self.config,
+            'max_workers': self.max_workers,
+            'block_padding': self.block_padding,
+            'min_block_area': self.min_block_area,
+            'tesseract': tesseract_version(),
+        }
+
+    def image_to_data(self, gray_text, text_mask=None, cancel_check=None):
+        # cancel_check() 在每组文本块识别之前调用，抛出异常即可中止；取消时不写缓存
+        arrays = (gray_text,) if text_mask is None else (gray_text, text_mask)
+        key = content_hash(*arrays, **self.cache_params())
+        text_data = self.cache.get(key)
+        if text_data is None:
+            text_data = self._image_to_data(gray_text, text_mask, cancel_check)
+            self.cache.put(key, text_data)
+        # 返回副本，调用方修改结果不会影响缓存
+        return {name: list(values) for name, values in text_data.items()}
+
+    def _image_to_data(self, gray_text, text_mask, cancel_check=None):
+        groups = self.text_block_groups(text_mask) if text_mask is not None and self.max_workers > 1 else []
+        if len(groups) <= 1:
+            return self._ocr(gray_text)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(groups))) as pool:
+            results = list(pool.map(lambda group: self._ocr_group(gray_text, group, cancel_check), groups))
+
+        return self.merge_results(results)
+
+    def text_block_groups(self, text_mask):
+        # 文字掩码的连通区域膨胀后得到行/段落级的文本块
+        boxes = mask_bounding_boxes(text_mask, padding=self.block_padding, min_area=self.min_block_area)
+        if not boxes:
+            return []
+
+        # 文本块太多时按阅读顺序分组，每组一次 tesseract 调用，避免进程启动开销淹没并行收益
+        group_count = min(len(boxes), self.max_workers * 2)
+        total_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes)
+        target_area = total_area / group_count
+
+        groups = []
+        current = []
+        current_area = 0
+        for box in boxes:
+            current.append(box)
+            current_area += (box[2] - box[0]) * (box[3] - box[1])
+            if current_area >= target_area and len(groups) < group_count - 1:
+                groups.append(current)
+                current = []
+                current_area = 0
+        if current:
+            groups.append(current)
+        return groups
+
+    def _ocr_group(self, gray_text, group, cancel_check=None):
+        # 已经取消时，线程池中排队的组直接退出，不再启动 tesseract
+        if cancel_check is not None:
+            cancel_check()
+        x0 = min(box[0] for box in group)
+        y0 = min(box[1] for box in group)
+        x1 = max(box[2] for box in group)
+        y1 = max(box[3] for box in group)
+
+        # 只保留本组文本块的像素，其余区域和页面背景一样填 0，避免相邻组的文字被重复识别
+        crop = np.zeros((y1 - y0, x1 - x0), dtype=gray_text.dtype)
+        for bx0, by0, bx1, by1 in group:
+            crop[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0] = gray_text[by0:by1, bx0:bx1]
+
+        return self._ocr(crop), (x0, y0)
+
+    def _ocr(self, image):
+        return pytesseract.image_to_data(image, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+
+    @staticmethod
+    def merge_results(results):
+        # 把各组的单词框平移回页面坐标，并重新编号 block_num 保证唯一
+        merged = {}
+        block_offset = 0
+        for data, (x0, y0) in results:
+            count = len(data.get('text', []))
+            for key, values in data.items():
+                values = list(values)
+                if key == 'left':
+                    values = [int(v) + x0 for v in values]
+                elif key == 'top':
+                    values = [int(v) + y0 for v in values]
+                elif key == 'block_num':
+                    values = [int(v) + block_offset for v in values]
+                merged.setdefault(key, []).extend(values)
+            if count:
+                block_offset = max(merged.get('block_num', [block_offset]))
+        return merged
@@ -0,0 +1,117 @@
+import cv2
+
+# 界面/命令行中的插值方法名称
+INTERPOLATION_FLAGS = {
+    'Nearest': cv2.INTER_NEAREST,
+    'Bilinear': cv2.INTER_LINEAR,
+    'Bicubic': cv2.INTER_CUBIC,
+    'Lanczos': cv2.INTER_LANCZOS4,
+}
+
+
+# 质量/速度档位，每档按顺序列出可用的后端
+SR_TIERS = {
+    'quality': ('edsr', 'lapsrn'),
+    'balanced': ('lapsrn', 'fsrcnn', 'espcn'),
+    'fast': ('fsrcnn', 'espcn'),
+    'draft': ('interpolation',),
+}
+# auto 按这个顺序选择第一个在时间预算内的档位
+AUTO_TIER_ORDER = ('quality', 'balanced', 'fast', 'draft')
+SR_TIER_CHOICES = AUTO_TIER_ORDER + ('auto',)
+# auto 档位默认每页超分辨率的时间预算（秒）
+DEFAULT_TIME_BUDGET = 30.0
+
+
+def interpolation_flag(method, default=cv2.INTER_LANCZOS4):
+    return INTERPOLATION_FLAGS.get(method, default)
+
+
+class ScalePlan:
+    def __init__(self, scale_factor, output_size, model=None, tier=None, estimated_seconds=None):
+        self.scale_factor = scale_factor
+        # (width, height)
+        self.output_size = output_size
+        # (name, scale)，为 None 时不使用超分辨率模型，只做一次插值
+        self.model = model
+        self.tier = tier
+        self.estimated_seconds = estimated_seconds
+
+    @property
+    def uses_model(self):
+        return self.model is not None
+
+    @property
+    def model_scale(self):
+        return self.model[1] if self.model else 1
+
+    @property
+    def needs_resample(self):
+        # 模型输出与目标尺寸不一致时还需要一次插值
+        return self.scale_factor != self.model_scale
+
+    def __repr__(self):
+        model = f"{self.model[0]} x{self.model[1]}" if self.model else "interpolation"
+        return f"ScalePlan({self.scale_factor:.3g}x, {model}, tier={self.tier}, output={self.output_size})"
+
+
+class ScalePlanner:
+    # 根据缩放比例和档位选择最省计算量的路径：小比例只插值，否则选最接近比例的模型，再做一次插值
+    def __init__(self, registry, tier='quality', scales=(2, 3, 4, 8), min_model_scale=1.5,
+                 fallback=('edsr', 4), time_budget=None):
+        self.registry = registry
+        self.tier = tier
+        self.scales = scales
+        self.min_model_scale = min_model_scale
+        # quality 档位的模型一个都没有时沿用原来的 EDSR x4
+        self.fallback = fallback
+        self.time_budget = time_budget or DEFAULT_TIME_BUDGET
+
+    def output_size(self, width, height, scale_factor):
+        return int(width * scale_factor), int(height * scale_factor)
+
+    def available_models(self, models):
+        # 插值不是超分辨率模型，由计划中的最终插值完成
+        return [(name, scale) for scale in self.scales for name in models
+                if name != 'interpolation' and self.registry.is_available(name, scale)]
+
+    def plan(self, width, height, scale_factor, tier=None, time_budget=None):
+        tier = tier or self.tier
+        if tier not in SR_TIER_CHOICES:
+            raise ValueError(f"Unknown super-resolution tier: {tier}")
+        output_size = self.output_size(width, height, scale_factor)
+        if scale_factor <= self.min_model_scale:
+            return ScalePlan(scale_factor, output_size, tier=tier)
+
+        if tier == 'auto':
+            return self.auto_plan(width, height, scale_factor, output_size, time_budget or self.time_budget)
+
+        model = self.choose_model(scale_factor, SR_TIERS[tier])
+        if model is None and tier == 'quality':
+            model = self.fallback
+        return ScalePlan(scale_factor, output_size, model, tier=tier,
+                         estimated_seconds=self.estimate_seconds(width, height, model))
+
+    def auto_plan(self, width, height, scale_factor, output_size, time_budget):
+        # 从高质量到低质量，选第一个预计耗时在预算内的档位
+        for tier in AUTO_TIER_ORDER:
+            model = self.choose_model(scale_factor, SR_TIERS[tier])
+            if model is None and tier != 'draft':
+                continue
+            seconds = self.estimate_seconds(width, height, model)
+            if seconds <= time_budget or tier == 'draft':
+                return ScalePlan(scale_factor, output_size, model, tier=f"auto:{tier}", estimated_seconds=seconds)
+
+    def estimate_seconds(self, width, height, model):
+        name, scale = model or ('interpolation', 1)
+        return self.registry.get(name, scale).seconds_per_megapixel() * width * height / 1e6
+
+    def choose_model(self, scale_factor, models):
+        available = self.available_models(models)
+        if not available:
+            return None
+        # 优先选能直接达到目标比例的最小倍率（之后只需缩小），都不够时选最大倍率再放大
+        enough = [model for model in available if model[1] >= scale_factor]
+        if enough:
+            return min(enough, key=lambda model: model[1])
+        return max(available, key=lambda model: model[1])
@@ -9,18 +9,127 @@ Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查
 from PIL import Image
 import numpy as np
 
+# TIFF 标签
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_PLANAR_CONFIGURATION = 284
+TAG_TILE_WIDTH = 322
+
+
+class TIFPage:
+    def __init__(self, index, width, height, mode, dpi, compression, tiled, raw_rows):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.dpi = dpi
+        self.compression = compression
+        self.tiled = tiled
+        # 未压缩的条带/分块可以只读取需要的行
+        self.raw_rows = raw_rows
+
+    @property
+    def shape(self):
+        # read_image 总是返回 RGB
+        return (self.height, self.width, 3)
+
+
 class TIFReader:
     def __init__(self, file_path):
         self.file_path = file_path
+        self._pages = None
 
-    def get_dpi(self):
-        with Image.open(self.file_path) as img:
-            dpi = img.info.get('dpi', (72, 72))
-        return dpi[0]  # Assuming horizontal and vertical DPI are the same
+    def pages(self):
+        # 一次遍历读取所有页的元数据，不解码像素
+        if self._pages is None:
+            pages = []
+            with Image.open(self.file_path) as img:
+                for index in range(getattr(img, 'n_frames', 1)):
+                    img.seek(index)
+                    pages.append(self._page_info(img, index))
+            self._pages = pages
+        return self._pages
+
+    @property
+    def page_count(self):
+        return len(self.pages())
+
+    def _page_info(self, img, index):
+        dpi = img.info.get('dpi', (72, 72))
+        tags = getattr(img, 'tag_v2', {})
+        compression = tags.get(TAG_COMPRESSION, 1)
+        # 调色板图像的调色板要在整页解码时才可用，按整页读取
+        raw_rows = (compression == 1
+                    and img.mode != 'P'
+                    and tags.get(TAG_PLANAR_CONFIGURATION, 1) == 1
+                    and bool(img.tile)
+                    and all(tile[0] == 'raw' and tile[3][2:3] in ((), (1,)) for tile in img.tile))
+        return TIFPage(index, img.size[0], img.size[1], img.mode, dpi[0], compression,
+                       TAG_TILE_WIDTH in tags, raw_rows)
+
+    def get_dpi(self, page=0):
+        return self.pages()[page].dpi  # Assuming horizontal and vertical DPI are the same
 
-    def read_image(self):
+    def read_image(self, page=0):
         with Image.open(self.file_path) as img:
-            # Convert image to RGB mode if it's not already
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            return np.array(img)
+            img.seek(page)
+            return self._to_array(img)
+
+    def iter_pages(self):
+        # 逐页惰性解码，任意时刻只有一页在内存中
+        for page in self.pages():
+            yield page, self.read_image(page.index)
+
+    def iter_rows(self, page=0, band_height=512):
+        # 按行带读取；未压缩的 TIFF 只读取覆盖该行带的条带/分块，
+        # 压缩的页面由解码器整页解码一次后再切分
+        info = self.pages()[page]
+        if not info.raw_rows:
+            image = self.read_image(page)
+            for y0 in range(0, info.height, band_height):
+                yield y0, image[y0:y0 + band_height]
+            return
+
+        for y0 in range(0, info.height, band_height):
+            y1 = min(y0 + band_height, info.height)
+            yield y0, self.read_rows(y0, y1, page)
+
+    def read_rows(self, y0, y1, page=0):
+        info = self.pages()[page]
+        if not info.raw_rows:
+            return self.read_image(page)[y0:y1]
+
+        with Image.open(self.file_path) as img, open(self.file_path, 'rb') as f:
+            img.seek(page)
+            bits_per_pixel = self._bits_per_pixel(img)
+            band = Image.new(img.mode, (info.width, y1 - y0))
+
+            # 只读取与该行带相交的条带/分块中需要的行
+            for tile in img.tile:
+                _, (tx0, ty0, tx1, ty1), offset, args = tile
+                r0, r1 = max(ty0, y0), min(ty1, y1)
+                if r0 >= r1:
+                    continue
+                rawmode, stride = args[0], args[1]
+                stride = stride or ((tx1 - tx0) * bits_per_pixel + 7) // 8
+                f.seek(offset + (r0 - ty0) * stride)
+                data = f.read((r1 - r0) * stride)
+                piece = Image.frombytes(img.mode, (tx1 - tx0, r1 - r0), data, 'raw', rawmode, stride)
+                band.paste(piece, (tx0, r0 - y0))
+
+            return self._to_array(band)
+
+    @staticmethod
+    def _bits_per_pixel(img):
+        bits = img.tag_v2.get(TAG_BITS_PER_SAMPLE, 1)
+        if isinstance(bits, tuple):
+            bits = bits[0]
+        return bits * img.tag_v2.get(TAG_SAMPLES_PER_PIXEL, 1)
+
+    @staticmethod
+    def _to_array(img):
+        # Convert image to RGB mode if it's not already
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.array(img)
@@ -0,0 +1,257 @@
+import io
+import struct
+import zlib
+from fractions import Fraction
+
+import cv2
+import numpy as np
+from PIL import Image, features
+
+# TIFF 标签
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_FILL_ORDER = 266
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_X_RESOLUTION = 282
+TAG_Y_RESOLUTION = 283
+TAG_PLANAR_CONFIGURATION = 284
+TAG_T4_OPTIONS = 292
+TAG_T6_OPTIONS = 293
+TAG_RESOLUTION_UNIT = 296
+TAG_TILE_WIDTH = 322
+TAG_TILE_LENGTH = 323
+TAG_TILE_OFFSETS = 324
+TAG_TILE_BYTE_COUNTS = 325
+
+# TIFF 字段类型
+TYPE_SHORT = 3
+TYPE_LONG = 4
+TYPE_RATIONAL = 5
+TYPE_LONG8 = 16
+TYPE_FORMATS = {TYPE_SHORT: 'H', TYPE_LONG: 'I', TYPE_LONG8: 'Q'}
+
+# 压缩方式名称 -> (TIFF 压缩码, Pillow 编码器名)；lzw 和 group4 需要 Pillow 带 libtiff
+BILEVEL_COMPRESSIONS = {
+    'group4': (4, 'group4'),
+    'lzw': (5, 'tiff_lzw'),
+    'deflate': (8, None),
+    'none': (1, None),
+}
+# 未压缩数据超过这个大小时自动写 BigTIFF，给压缩后变大的极端情况留出余量
+BIGTIFF_THRESHOLD = 0xF0000000
+
+
+def pack_rows(rows):
+    # 3 通道或单通道的黑白行 -> 每像素 1 位，1 为白色；行尾补齐的位也置为白色
+    if rows.ndim == 3:
+        rows = cv2.cvtColor(rows, cv2.COLOR_BGR2GRAY)
+    packed = np.packbits(rows >= 128, axis=1)
+    remainder = rows.shape[1] % 8
+    if remainder:
+        packed[:, -1] |= 0xFF >> remainder
+    return packed
+
+
+class BilevelImage:
+    # 按位打包的黑白图像，内存是 3 通道 uint8 的 1/24
+    def __init__(self, width, height, data=None):
+        self.width = width
+        self.height = height
+        self.data = data if data is not None else np.empty((height, (width + 7) // 8), dtype=np.uint8)
+
+    @classmethod
+    def from_array(cls, image, band_height=256):
+        height, width = image.shape[:2]
+        bilevel = cls(width, height)
+        for y0 in range(0, height, band_height):
+            bilevel.data[y0:y0 + band_height] = pack_rows(image[y0:y0 + band_height])
+        return bilevel
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def to_array(self, y0=0, y1=None):
+        # 解包为 3 通道 uint8，可以只取部分行，用于显示
+        rows = np.unpackbits(self.data[y0:y1], axis=1, count=self.width)
+        return cv2.cvtColor(rows * np.uint8(255), cv2.COLOR_GRAY2BGR)
+
+
+class BilevelTIFWriter:
+    # 逐行带写入按位打包的黑白图像，输出分块（tile）、压缩的 (Big)TIFF。
+    # 每攒够一行分块就压缩写盘，内存里最多只有 tile_size 行打包数据；
+    # 图像目录（IFD）最后写，再回填文件头中的偏移
+    def __init__(self, path, width, height, dpi, compression='group4', tile_size=512, bigtiff=None):
+        if compression not in BILEVEL_COMPRESSIONS:
+            raise ValueError(f"Unknown bilevel compression: {compression}")
+        if tile_size % 16:
+            raise ValueError("TIFF tile size must be a multiple of 16")
+        self.code, self.encoder = BILEVEL_COMPRESSIONS[compression]
+        if self.encoder and not features.check('libtiff'):
+            raise RuntimeError(f"{compression} compression requires Pillow built with libtiff")
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.compression = compression
+        self.tile_size = tile_size
+        if bigtiff is None:
+            bigtiff = height * ((width + 7) // 8) > BIGTIFF_THRESHOLD
+        self.bigtiff = bigtiff
+        # 编码器输出需要的额外标签（光度解释、填充顺序等），从第一个 Pillow 编码的分块中取
+        self.codec_tags = {}
+        self.offsets = []
+        self.byte_counts = []
+        self.rows_written = 0
+        # 分块宽度对齐后的打包行缓冲，右侧补白
+        self.tile_bytes = tile_size // 8
+        self.tiles_across = -(-width // tile_size)
+        self.pending = np.full((tile_size, self.tiles_across * self.tile_bytes), 0xFF, dtype=np.uint8)
+        self.pending_rows = 0
+        self.file = open(path, 'wb')
+        if bigtiff:
+            self.file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+        else:
+            self.file.write(b'II' + struct.pack('<HI', 42, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_rows(self, packed):
+        # packed 为 pack_rows 的输出，按从上到下的顺序传入
+        row_bytes = packed.shape[1]
+        start = 0
+        while start < len(packed):
+            count = min(self.tile_size - self.pending_rows, len(packed) - start)
+            self.pending[self.pending_rows:self.pending_rows + count, :row_bytes] = packed[start:start + count]
+            self.pending_rows += count
+            start += count
+            if self.pending_rows == self.tile_size:
+                self.flush_tiles()
+        self.rows_written += len(packed)
+
+    def write_image(self, image, band_height=256):
+        # image 为 BilevelImage 或黑白 uint8 数组（按行带打包，不转换整页）
+        if isinstance(image, BilevelImage):
+            for y0 in range(0, image.height, band_height):
+                self.write_rows(image.data[y0:y0 + band_height])
+        else:
+            for y0 in range(0, image.shape[0], band_height):
+                self.write_rows(pack_rows(image[y0:y0 + band_height]))
+
+    def flush_tiles(self):
+        for tile in range(self.tiles_across):
+            x0 = tile * self.tile_bytes
+            data = self.encode(np.ascontiguousarray(self.pending[:, x0:x0 + self.tile_bytes]))
+            self.offsets.append(self.file.tell())
+            self.byte_counts.append(len(data))
+            self.file.write(data)
+        # 最后一行分块的下方同样补白
+        self.pending.fill(0xFF)
+        self.pending_rows = 0
+
+    def encode(self, tile):
+        if self.compression == 'none':
+            return tile.tobytes()
+        if self.compression == 'deflate':
+            return zlib.compress(tile.tobytes(), 6)
+        # lzw/group4 借用 Pillow 的 libtiff 编码器：把单个分块写成只有一个条带的小 TIFF，再取出条带数据
+        buffer = io.BytesIO()
+        Image.frombytes('1', (self.tile_size, self.tile_size), tile.tobytes()).save(
+            buffer, 'TIFF', compression=self.encoder, tiffinfo={TAG_ROWS_PER_STRIP: self.tile_size})
+        with Image.open(buffer, formats=['TIFF']) as encoded:
+            tags = encoded.tag_v2
+            if len(tags[TAG_STRIP_OFFSETS]) != 1:
+                raise RuntimeError("Pillow wrote more than one strip for a TIFF tile")
+            if not self.codec_tags:
+                self.codec_tags = {tag: tags[tag] for tag in (TAG_PHOTOMETRIC, TAG_FILL_ORDER, TAG_T4_OPTIONS,
+                                                              TAG_T6_OPTIONS) if tag in tags}
+            offset, length = tags[TAG_STRIP_OFFSETS][0], tags[TAG_STRIP_BYTE_COUNTS][0]
+        return buffer.getbuffer()[offset:offset + length].tobytes()
+
+    def close(self):
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"Wrote {self.rows_written} rows, expected {self.height}")
+        if self.pending_rows:
+            self.flush_tiles()
+        self.write_ifd()
+        self.file.close()
+
+    def write_ifd(self):
+        offset_type = TYPE_LONG8 if self.bigtiff else TYPE_LONG
+        resolution = Fraction(self.dpi).limit_denominator(1 << 16)
+        entries = {
+            TAG_IMAGE_WIDTH: (TYPE_LONG, [self.width]),
+            TAG_IMAGE_LENGTH: (TYPE_LONG, [self.height]),
+            TAG_BITS_PER_SAMPLE: (TYPE_SHORT, [1]),
+            TAG_COMPRESSION: (TYPE_SHORT, [self.code]),
+            # 1 = BlackIsZero，与 pack_rows 中 1 为白色一致
+            TAG_PHOTOMETRIC: (TYPE_SHORT, [1]),
+            TAG_SAMPLES_PER_PIXEL: (TYPE_SHORT, [1]),
+            TAG_X_RESOLUTION: (TYPE_RATIONAL, [resolution.numerator, resolution.denominator]),
+            TAG_Y_RESOLUTION: (TYPE_RATIONAL, [resolution.numerator, resolution.denominator]),
+            TAG_PLANAR_CONFIGURATION: (TYPE_SHORT, [1]),
+            TAG_RESOLUTION_UNIT: (TYPE_SHORT, [2]),
+            TAG_TILE_WIDTH: (TYPE_LONG, [self.tile_size]),
+            TAG_TILE_LENGTH: (TYPE_LONG, [self.tile_size]),
+            TAG_TILE_OFFSETS: (offset_type, self.offsets),
+            TAG_TILE_BYTE_COUNTS: (offset_type, self.byte_counts),
+        }
+        for tag, value in self.codec_tags.items():
+            entries[tag] = (TYPE_LONG if tag in (TAG_T4_OPTIONS, TAG_T6_OPTIONS) else TYPE_SHORT, [int(value)])
+
+        inline = 8 if self.bigtiff else 4
+        # 放不进目录项的值（分块偏移表、分辨率）先写在目录之前
+        packed_entries = []
+        for tag in sorted(entries):
+            field_type, values = entries[tag]
+            if field_type == TYPE_RATIONAL:
+                data, count = struct.pack('<2I', *values), 1
+            else:
+                data, count = struct.pack(f'<{len(values)}{TYPE_FORMATS[field_type]}', *values), len(values)
+            if len(data) <= inline:
+                value = data.ljust(inline, b'\0')
+            else:
+                self.align()
+                offset = self.file.tell()
+                self.file.write(data)
+                value = struct.pack('<Q' if self.bigtiff else '<I', offset)
+            packed_entries.append((tag, field_type, count, value))
+
+        self.align()
+        ifd_offset = self.file.tell()
+        if self.bigtiff:
+            self.file.write(struct.pack('<Q', len(packed_entries)))
+            for tag, field_type, count, value in packed_entries:
+                self.file.write(struct.pack('<HHQ', tag, field_type, count) + value)
+            self.file.write(struct.pack('<Q', 0))
+            self.file.seek(8)
+            self.file.write(struct.pack('<Q', ifd_offset))
+        else:
+            self.file.write(struct.pack('<H', len(packed_entries)))
+            for tag, field_type, count, value in packed_entries:
+                self.file.write(struct.pack('<HHI', tag, field_type, count) + value)
+            self.file.write(struct.pack('<I', 0))
+            self.file.seek(4)
+            self.file.write(struct.pack('<I', ifd_offset))
+
+    def align(self):
+        # TIFF 要求偏移为偶数
+        if self.file.tell() % 2:
+            self.file.write(b'\0')
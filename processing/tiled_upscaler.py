@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class TiledUpscaler:
+    def __init__(self, sr, scale=4, tile_size=256, halo=16, skip_empty=True):
+        # sr 只需要提供 upsample(image) 方法，例如 cv2.dnn_superres 的 DnnSuperResImpl
+        if tile_size <= 0:
+            raise ValueError("tile_size must be positive")
+        if halo < 0:
+            raise ValueError("halo must be non-negative")
+        self.sr = sr
+        self.scale = scale
+        self.tile_size = tile_size
+        self.halo = halo
+        # 全黑的分块（被掩码去掉的区域）不送入模型，输出保持为 0
+        self.skip_empty = skip_empty
+        # 羽化带宽度（输入像素），相邻两块在接缝处各向外多写 feather 个像素
+        self.feather = halo // 2
+
+    def upscale(self, image, cancel_check=None):
+        # cancel_check() 在每个分块之前调用，抛出异常即可中止
+        height, width = image.shape[:2]
+        s = self.scale
+
+        # 小图直接单次放大
+        if height <= self.tile_size and width <= self.tile_size:
+            if self.skip_empty and not image.any():
+                return np.zeros((height * s, width * s) + image.shape[2:], dtype=image.dtype)
+            return self.sr.upsample(image)
+
+        # 预分配输出缓冲区，峰值内存只额外取决于单个分块的大小
+        output = np.zeros((height * s, width * s) + image.shape[2:], dtype=image.dtype)
+
+        for y0 in range(0, height, self.tile_size):
+            y1 = min(y0 + self.tile_size, height)
+            for x0 in range(0, width, self.tile_size):
+                x1 = min(x0 + self.tile_size, width)
+                if cancel_check is not None:
+                    cancel_check()
+                self._process_tile(image, output, y0, y1, x0, x1)
+
+        return output
+
+    def _process_tile(self, image, output, y0, y1, x0, x1):
+        height, width = image.shape[:2]
+        s = self.scale
+        h = self.halo
+        f = self.feather
+
+        # 带 halo 的输入区域，为卷积提供上下文
+        ey0, ey1 = max(y0 - h, 0), min(y1 + h, height)
+        ex0, ex1 = max(x0 - h, 0), min(x1 + h, width)
+        source = image[ey0:ey1, ex0:ex1]
+        if self.skip_empty and not source.any():
+            return
+        tile = self.sr.upsample(np.ascontiguousarray(source))
+
+        # 实际写入区域：核心区域向外扩展羽化带
+        wy0, wy1 = max(y0 - f, 0), min(y1 + f, height)
+        wx0, wx1 = max(x0 - f, 0), min(x1 + f, width)
+        patch = tile[(wy0 - ey0) * s:(wy1 - ey0) * s, (wx0 - ex0) * s:(wx1 - ex0) * s]
+
+        # 左侧和上侧与已写入的分块重叠，在重叠带内线性过渡
+        ramp_x = self._ramp((wx1 - wx0) * s, (min(x0 + f, wx1) - wx0) * s if x0 > 0 else 0)
+        ramp_y = self._ramp((wy1 - wy0) * s, (min(y0 + f, wy1) - wy0) * s if y0 > 0 else 0)
+
+        target = output[wy0 * s:wy1 * s, wx0 * s:wx1 * s]
+        if ramp_x is None and ramp_y is None:
+            target[...] = patch
+            return
+
+        weight = np.ones((target.shape[0], target.shape[1]), dtype=np.float32)
+        if ramp_x is not None:
+            weight *= ramp_x[np.newaxis, :]
+        if ramp_y is not None:
+            weight *= ramp_y[:, np.newaxis]
+        if target.ndim == 3:
+            weight = weight[:, :, np.newaxis]
+
+        blended = target * (1.0 - weight) + patch * weight
+        if np.issubdtype(output.dtype, np.integer):
+            info = np.iinfo(output.dtype)
+            blended = np.clip(np.rint(blended), info.min, info.max)
+        target[...] = blended
+
+    @staticmethod
+    def _ramp(length, overlap):
+        if overlap <= 0:
+            return None
+        ramp = np.ones(length, dtype=np.float32)
+        ramp[:overlap] = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+        return ramp
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# GUI 使用的持久缓存目录
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tif_dpi_enhancer')
+# 每个磁盘缓存目录的默认上限
+DEFAULT_MAX_DISK_BYTES = 4 * 1024 * 1024 * 1024
+
+
+def content_hash(*arrays, **params):
+    # 对像素缓冲区和参数计算内容哈希，作为缓存键
+    h = hashlib.blake2b(digest_size=20)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(f"{array.shape}{array.dtype.str}".encode())
+        h.update(array.data)
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+def _value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_value_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_value_size(v) for v in value.values())
+    return 0
+
+
+class TieredCache:
+    # 内存 LRU + 可选的磁盘缓存；磁盘命中的结果会提升到内存中。
+    # 磁盘缓存超过 max_disk_bytes 时按修改时间删除最旧的文件，读取命中会刷新修改时间
+    def __init__(self, max_entries=16, max_bytes=None, cache_dir=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+        self._write_disk(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key, value):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        size = _value_size(value)
+        self._entries[key] = (value, size)
+        self._bytes += size
+        # 超出条目数或内存上限时淘汰最久未使用的条目
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write_disk(self, key, value):
+        if not self.cache_dir:
+            return
+        # 先写临时文件再重命名，多个进程同时写入时也不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._trim_disk()
+
+    def _trim_disk(self):
+        if self.max_disk_bytes is None:
+            return
+        # 每次都重新扫描目录：多个进程可能同时写同一个缓存目录
+        files = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.pkl'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError:
+            return
+        if total <= self.max_disk_bytes:
+            return
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # 其他进程已经删除，或者文件正在被读取（Windows）
+                continue
+            total -= size
@@ -9,4 +9,67 @@ def adjust_gamma(image, gamma=1.0):
 def sharpen_image(image, amount=1.0):
     blurred = cv2.GaussianBlur(image, (0, 0), 3)
     sharpened = cv2.addWeighted(image, 1.0 + amount, blurred, -amount, 0)
-    return np.clip(sharpened, 0, 255).astype(np.uint8)
\ No newline at end of file
+    return np.clip(sharpened, 0, 255).astype(np.uint8)
+
+def mask_bounding_boxes(mask, padding=0, min_area=1):
+    # 根据连通区域计算外接矩形 (x0, y0, x1, y1)，向外扩展 padding 并合并重叠的矩形
+    binary = (mask > 0).astype(np.uint8)
+    if padding > 0:
+        # 先膨胀，让相距不到 2*padding 的区域直接连成一个连通域
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * padding + 1, 2 * padding + 1))
+        binary = cv2.dilate(binary, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = stats[1:][areas >= min_area]
+    boxes = [(int(x), int(y), int(x + w), int(y + h))
+             for x, y, w, h in keep[:, :4]]
+
+    return merge_boxes(boxes)
+
+def merge_boxes(boxes):
+    # 反复合并相交的矩形，直到没有重叠
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            x0, y0, x1, y1 = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                bx0, by0, bx1, by1 = boxes[i]
+                if bx0 < x1 and x0 < bx1 and by0 < y1 and y0 < by1:
+                    x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append((x0, y0, x1, y1))
+        boxes = result
+    return sorted(boxes, key=lambda b: (b[1], b[0]))
+
+def resize_rows(band, band_y0, source_size, dst_size, dst_y0, dst_y1, interpolation=cv2.INTER_LINEAR):
+    # 计算 cv2.resize(source, dst_size) 结果中 [dst_y0, dst_y1) 这几行，band 是 source 从 band_y0 开始的若干行；
+    # band 需要比这几行对应的源区域多出几行上下文，按行带处理时拼接结果与整图缩放一致
+    src_w, src_h = source_size
+    dst_w, dst_h = dst_size
+    band_y1 = band_y0 + band.shape[0]
+    if (band_y0 * dst_h) % src_h == 0 and (band_y1 * dst_h) % src_h == 0:
+        # 行带边界正好落在目标像素边界上，对行带单独 resize 的采样位置与整图完全相同，直接用更快的 cv2.resize
+        top, bottom = band_y0 * dst_h // src_h, band_y1 * dst_h // src_h
+        if top <= dst_y0 and dst_y1 <= bottom:
+            resized = cv2.resize(band, (dst_w, bottom - top), interpolation=interpolation)
+            return resized[dst_y0 - top:dst_y1 - top]
+
+    fx, fy = src_w / dst_w, src_h / dst_h
+    if interpolation == cv2.INTER_NEAREST:
+        # cv2.resize 的最近邻取 floor(dst * f)，warpAffine 是四舍五入，平移半个像素（加一点余量避开定点误差）
+        offset_x, offset_y = -0.5 + 1e-4, dst_y0 * fy - 0.5 + 1e-4
+    else:
+        # 与 cv2.resize 相同的像素中心对齐：src = (dst + 0.5) * f - 0.5
+        offset_x, offset_y = 0.5 * fx - 0.5, (dst_y0 + 0.5) * fy - 0.5
+    matrix = np.array([[fx, 0, offset_x],
+                       [0, fy, offset_y - band_y0]], dtype=np.float64)
+    return cv2.warpAffine(band, matrix, (dst_w, dst_y1 - dst_y0),
+                          flags=interpolation | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from utils.memory_utils import current_rss, peak_rss
+
+_NULL_SPAN = nullcontext()
+
+
+def array_stats(array):
+    # 只在开启分析时调用，min/max 需要完整遍历数组
+    return {
+        'shape': list(array.shape),
+        'dtype': str(array.dtype),
+        'min': array.min().item() if array.size else None,
+        'max': array.max().item() if array.size else None,
+    }
+
+
+class Profiler:
+    # 命名阶段的耗时/CPU/内存记录，默认关闭；设置环境变量 TIF_DPI_PROFILE=1 开启。
+    # CPU 时间是整个进程的（包括阶段内线程池的工作线程，也包括同时运行的其他阶段），
+    # process_peak_rss 是进程运行以来的峰值，不是单个阶段的峰值
+    def __init__(self, enabled=None, origin=None):
+        if enabled is None:
+            enabled = os.environ.get('TIF_DPI_PROFILE', '') not in ('', '0')
+        self.enabled = enabled
+        self.metadata = {}
+        self.spans = []
+        # 多个进程共用同一个起点时，合并后的 trace 时间轴是对齐的
+        self._origin = time.perf_counter() if origin is None else origin
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, attrs)
+
+    @contextmanager
+    def _span(self, name, attrs):
+        stack = self._stack()
+        record = {'name': name, 'args': dict(attrs), 'tid': threading.get_ident(), 'pid': os.getpid()}
+        stack.append(record)
+        rss_before = current_rss()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            record.update({
+                'start': start - self._origin,
+                'wall': end - start,
+                'cpu': time.process_time() - cpu_start,
+                'rss_before': rss_before,
+                'rss_after': current_rss(),
+                'process_peak_rss': peak_rss(),
+            })
+            with self._lock:
+                self.spans.append(record)
+
+    def annotate(self, **attrs):
+        # 给当前线程最内层的阶段附加信息
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1]['args'].update(attrs)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def reset(self):
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def summary(self):
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'process_peak_rss': 0})
+            stage['count'] += 1
+            stage['wall'] += span['wall']
+            stage['cpu'] += span['cpu']
+            stage['process_peak_rss'] = max(stage['process_peak_rss'], span['process_peak_rss'] or 0)
+        return stages
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {'metadata': self.metadata, 'summary': self.summary(), 'spans': spans}
+
+    def to_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+    def to_chrome_trace(self, path, spans=None):
+        # chrome://tracing / Perfetto 可以直接打开
+        if spans is None:
+            with self._lock:
+                spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = dict(span['args'])
+            args.update({'cpu_ms': span['cpu'] * 1000, 'rss_after': span['rss_after'],
+                         'process_peak_rss': span['process_peak_rss']})
+            events.append({
+                'name': span['name'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['wall'] * 1e6,
+                'pid': span['pid'],
+                'tid': span['tid'],
+                'args': args,
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'metadata': self.metadata}, f, default=str)
+
+
+_default_profiler = None
+
+
+def get_profiler():
+    global _default_profiler
+    if _default_profiler is None:
+        _default_profiler = Profiler()
+    return _default_profiler